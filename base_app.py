@@ -23,21 +23,87 @@
 """
 # Streamlit dependencies
 import streamlit as st
-import joblib,os
+import os
+import shutil
+import tempfile
 
 from streamlit_option_menu import option_menu # need to pip install streamlit-option-menu to use this
 
 # Data dependencies
 import pandas as pd
 import datetime
-import numpy as np
 
-# Vectorizer
-news_vectorizer = open("resources/vect.pkl","rb")
-tweet_cv = joblib.load(news_vectorizer) # loading your vectorizer from the pkl file
+# Model dependencies
+from model_registry import registry, VECTORIZER, MODEL_NAMES
+import inference
+import batch_classify
+import prediction_cache
+import metrics
+
+# Data dependencies (raw data is loaded lazily, and cached, when a page needs it)
+import training_data
+import eda_aggregates
+import similar_tweets
+import submission_store
+import image_assets
+import online_learning
+
+# Load every artifact once per process (set MODEL_WARMUP=0 to load lazily instead)
+if os.environ.get("MODEL_WARMUP", "1") != "0":
+	registry.warm_up()
+
+# Serve the active online-learning snapshot of the SGD model and start learning from corrections
+if online_learning.ENABLED:
+	online_learning.get_learner()
 
-# Load your raw data
-raw = pd.read_csv("resources/train.csv")
+# Vectorizer
+tweet_cv = registry.get(VECTORIZER) # shared, process-wide copy of resources/vect.pkl
+
+# Images are shown from web-sized variants rendered on first use (see image_assets.py)
+def show_image(path, caption=None, width=None):
+	"""Display a resources/imgs image at the given width without shipping the full-size file"""
+	url = image_assets.image_url(path, width, static_serving=st.get_option("server.enableStaticServing"))
+	st.image(url, caption=caption, width=width or "content")
+
+# Operations page with latency, cache and model information
+def ops_page():
+	"""Hidden page showing the app's internal metrics"""
+	st.info("🛠️ Operations")
+	if not metrics.ENABLED:
+		st.warning("Metrics are disabled (APP_METRICS=0)")
+
+	st.markdown("#### Stage latencies")
+	st.dataframe(pd.DataFrame(metrics.metrics.summary()))
+
+	col1, col2 = st.columns(2)
+
+	with col1:
+		st.markdown("#### Counters")
+		st.json(metrics.metrics.counters())
+
+	with col2:
+		st.markdown("#### Prediction cache")
+		st.json(prediction_cache.cache.stats())
+
+	st.markdown("#### Models")
+	st.dataframe(pd.DataFrame(registry.list_models()))
+
+	if online_learning.ENABLED:
+		learner = online_learning.get_learner()
+		st.markdown("#### Online learning (SGD)")
+		st.write("Serving snapshot v{}, {} corrections queued".format(learner.current_version, learner.pending()))
+		versions = learner.versions()
+		if versions:
+			st.dataframe(pd.DataFrame(versions))
+		if learner.current_version and st.button("Roll back SGD snapshot"):
+			learner.rollback()
+
+	st.markdown("#### Slow requests (over {:g} ms)".format(metrics.SLOW_REQUEST_MS))
+	st.json(list(metrics.metrics.slow_requests))
+
+	st.download_button("Download Prometheus metrics", metrics.metrics.render_prometheus(), file_name="metrics.prom")
+	if st.button("Reset metrics"):
+		metrics.metrics.reset()
 
 # The main function where we will build the actual app
 def main():
@@ -49,22 +115,28 @@ def main():
 	st.title("TrendInsights™")
 	# st.subheader("Climate change tweet classification")
 
+	# Hidden operations page, reached by adding ?ops=1 to the URL
+	if st.query_params.get("ops") == "1":
+		ops_page()
+		return
+
 	# Creating sidebar with selection box -
 	# you can create multiple pages this way
 	# with st.sidebar:
-	selection = option_menu(
-		menu_title = None,
-		options = ["Info", "Predict", "EDA", "Models", "About Us", "Contact"],
-		icons = ["info-square", "twitter", "bar-chart-line", "book", "people-fill", "envelope"],
-		default_index = 1,
-		menu_icon = "house",
-		orientation = "horizontal",
-		styles = {
-        "container": {"padding": "0!important", "background-color": "#fafafa"},
-        "icon": {"color": "black", "font-size": "25px"}, 
-        "nav-link": {"font-size": "25px", "text-align": "left", "margin":"0px", "--hover-color": "#eee"},
-        "nav-link-selected": {"background-color": "lightskyblue"},
-    })
+	with metrics.timer("menu"):
+		selection = option_menu(
+			menu_title = None,
+			options = ["Info", "Predict", "EDA", "Models", "About Us", "Contact"],
+			icons = ["info-square", "twitter", "bar-chart-line", "book", "people-fill", "envelope"],
+			default_index = 1,
+			menu_icon = "house",
+			orientation = "horizontal",
+			styles = {
+	        "container": {"padding": "0!important", "background-color": "#fafafa"},
+	        "icon": {"color": "black", "font-size": "25px"}, 
+	        "nav-link": {"font-size": "25px", "text-align": "left", "margin":"0px", "--hover-color": "#eee"},
+	        "nav-link-selected": {"background-color": "lightskyblue"},
+	    })
 	# selection = st.sidebar.radio("Choose Option", options)
 
 	# Building out the "EDA" page
@@ -87,7 +159,29 @@ def main():
 		st.info("📈 To view the raw data, select the checkbox below.")
 		# st.subheader("Raw Twitter data and label")
 		if st.checkbox("Show raw data"): # data is hidden if box is unchecked
-			st.write(raw[['sentiment', 'message']]) # will write the df to the page
+			raw = training_data.load_training_data() # only read when first needed
+			col1, col2, col3 = st.columns(3)
+
+			with col1:
+				sentiments = st.multiselect("Sentiment", list(inference.LABELS), format_func=inference.LABELS.get)
+
+			with col2:
+				contains = st.text_input("Message contains")
+
+			with col3:
+				# A slider needs max > min, even with no (or only empty) messages
+				longest = max(int(raw["length"].max()) if len(raw) else 0, 1)
+				min_length, max_length = st.slider("Message length", 0, longest, (0, longest))
+
+			page_size = 50
+			# Filter and paginate on the server so only one page is sent to the browser
+			matches = training_data.filter_rows(raw, sentiments, contains, min_length, max_length)
+			total = len(matches)
+			page = st.number_input("Page", min_value=1, max_value=training_data.page_count(total, page_size), value=1, step=1)
+			rows = training_data.paginate(matches, page - 1, page_size)
+			st.caption("Showing {:,}-{:,} of {:,} matching tweets".format(
+				min((page - 1) * page_size + 1, total), min(page * page_size, total), total))
+			st.write(rows[['sentiment', 'message']]) # will write the page to the app
 
 	# Building out the "EDA" page
 	if selection == "EDA":
@@ -97,14 +191,29 @@ def main():
 
 		st.markdown("The figures below were extracted during the exploritory data analysis (EDA) part of this project. Some additional information is provided alongside the figures.")
 		st.markdown("---")
-		
+
+		# Live charts come from precomputed summaries of the training data;
+		# without resources/train.csv the static figures are shown instead
+		summary = eda_aggregates.get_summary() if os.path.exists(eda_aggregates.TRAIN_CSV) else None
+		if summary:
+			class_names = {key: inference.LABELS.get(int(key), key) for key in summary["class_counts"]}
+			class_counts = pd.Series({class_names[k]: v for k, v in summary["class_counts"].items()}).sort_values(ascending=False)
+
 		col1, col2 = st.columns(2)
 
 		with col1:
-			st.image("resources/imgs/figure_1.png")
+			if summary:
+				st.markdown("**Number of tweets per sentiment**")
+				st.bar_chart(class_counts)
+			else:
+				show_image("resources/imgs/figure_1.png")
 
 		with col2:
-			st.image("resources/imgs/figure_2.png")
+			if summary:
+				st.markdown("**Share of tweets per sentiment (%)**")
+				st.bar_chart((100 * class_counts / class_counts.sum()).round(1))
+			else:
+				show_image("resources/imgs/figure_2.png")
 		
 		st.markdown("The previous two plots indicate that our dataset is not balanced. There are more entries belonging to people who have the belief of man-made climate change. Over 50% of the data is comprised of such tweets.")
 		st.markdown("---")
@@ -116,7 +225,13 @@ def main():
 			st.write(" ")
 
 		with col2:
-			st.image("resources/imgs/figure_3.png")
+			if summary:
+				st.markdown("**Tweet length (characters) per sentiment**")
+				lengths = pd.DataFrame({class_names[k]: v for k, v in summary["length_histograms"].items()},
+					index=[i * eda_aggregates.LENGTH_BIN for i in range(eda_aggregates.LENGTH_BINS)])
+				st.line_chart(lengths)
+			else:
+				show_image("resources/imgs/figure_3.png")
 
 		with col3:
 			st.write(" ")
@@ -130,12 +245,21 @@ def main():
 			st.write(" ")
 
 		with col2:
-			st.image("resources/imgs/figure_4.png")
+			if not summary:
+				show_image("resources/imgs/figure_4.png")
 
 		with col3:
 			st.write(" ")
 
-		st.markdown("The following bullet points relate to the figure above:")
+		if summary:
+			st.markdown("**Top hashtags per sentiment**")
+			columns = st.columns(len(class_names))
+			for column, key in zip(columns, sorted(class_names, key=int)):
+				with column:
+					st.markdown(class_names[key])
+					st.bar_chart(pd.Series(dict(eda_aggregates.top(summary["hashtags"].get(key, {}))), dtype=int))
+
+		st.markdown("The following bullet points relate to the {} above:".format("hashtag charts" if summary else "figure"))
 		st.markdown("- `#climate` and `#climatechange` are expected to be the most popular as they are our key identifier in tweets.")
 		st.markdown("- `#BeforeTheFlood` surfaced after a [documentary](https://en.wikipedia.org/wiki/Before_the_Flood_(film)) about environmental degradation that leads to global warming and suggestions on how to reduce it, narrated by Leonardo DiCaprio. This hashtag is most popular in tweets belonging in the `Pro` and `Neutral` categories.")
 		st.markdown("- `#trump` is one of the top hashtags for the Anti class. This could possibly be due to Donald Trump calling climate change a [\"hoax\"](https://www.motherjones.com/environment/2016/12/trump-climate-timeline/) multiple times.")
@@ -148,7 +272,16 @@ def main():
 			st.write(" ")
 
 		with col2:
-			st.image("resources/imgs/figure_5.png")
+			if summary:
+				st.markdown("**Most mentioned accounts**")
+				mention_class = st.selectbox("Sentiment", ["All"] + [class_names[k] for k in sorted(class_names, key=int)])
+				if mention_class == "All":
+					mentions = eda_aggregates.merged(summary["mentions"])
+				else:
+					mentions = summary["mentions"].get({v: k for k, v in class_names.items()}[mention_class], {})
+				st.bar_chart(pd.Series(dict(eda_aggregates.top(mentions)), dtype=int))
+			else:
+				show_image("resources/imgs/figure_5.png")
 
 		with col3:
 			st.write(" ")
@@ -169,21 +302,18 @@ def main():
 
 	# Building out the predication page
 	if selection == "Predict":
-		output = {-1: "Anti", 0: "Neutral", 1: "Pro", 2: "News"}
+		output = inference.LABELS
 		st.info("🗳️ Which model would you like to use?")
 		# Creating a text box for user input
 		model = st.radio(" ", 
-		   ("LinearSVC", "Logistic Regression", "Stochastic Gradient Descent (SGD)"), horizontal=True)
+		   ("LinearSVC", "Logistic Regression", "Stochastic Gradient Descent (SGD)", "Compare all models"), horizontal=True)
 
 		if model == "LinearSVC":
 			tweet_text = st.text_area("Enter text (Replace text below)", "CHECK OUT THESE WEATHER STORIES https://t.co/LwVzcPO30e Do Not believe the Global warming climate change stories sold by UN, Vatican &amp; Obama")
 			if st.button("Classify"):
-				# Transforming user input with vectorizer
-				vect_text = tweet_cv.transform([tweet_text]).toarray()
-				# Load your .pkl file with the model of your choice + make predictions
-				# Try loading in multiple models to give the user a choice
-				predictor = joblib.load(open(os.path.join("resources/final_lsvc.pkl"),"rb"))
-				prediction = predictor.predict(vect_text)
+				# Vectorize + predict, reusing the result if this text was seen before
+				with metrics.request("classify", model="LinearSVC", input_size=len(tweet_text)):
+					prediction = prediction_cache.predict_texts("LinearSVC", [tweet_text])
 
 				# When model has successfully run, will print prediction
 				# You can use a dictionary or similar structure to make this output
@@ -193,12 +323,9 @@ def main():
 		if model == "Logistic Regression":
 			tweet_text = st.text_area("Enter text (Replace text below)", "CHECK OUT THESE WEATHER STORIES https://t.co/LwVzcPO30e Do Not believe the Global warming climate change stories sold by UN, Vatican &amp; Obama")
 			if st.button("Classify"):
-				# Transforming user input with vectorizer
-				vect_text = tweet_cv.transform([tweet_text]).toarray()
-				# Load your .pkl file with the model of your choice + make predictions
-				# Try loading in multiple models to give the user a choice
-				predictor = joblib.load(open(os.path.join("resources/final_logistic.pkl"),"rb"))
-				prediction = predictor.predict(vect_text)
+				# Vectorize + predict, reusing the result if this text was seen before
+				with metrics.request("classify", model="Logistic Regression", input_size=len(tweet_text)):
+					prediction = prediction_cache.predict_texts("Logistic Regression", [tweet_text])
 
 				# When model has successfully run, will print prediction
 				# You can use a dictionary or similar structure to make this output
@@ -208,23 +335,82 @@ def main():
 		if model == "Stochastic Gradient Descent (SGD)":
 			tweet_text = st.text_area("Enter text (Replace text below)", "CHECK OUT THESE WEATHER STORIES https://t.co/LwVzcPO30e Do Not believe the Global warming climate change stories sold by UN, Vatican &amp; Obama")
 			if st.button("Classify"):
-				# Transforming user input with vectorizer
-				vect_text = tweet_cv.transform([tweet_text]).toarray()
-				# Load your .pkl file with the model of your choice + make predictions
-				# Try loading in multiple models to give the user a choice
-				predictor = joblib.load(open(os.path.join("resources/final_SGD.pkl"),"rb"))
-				prediction = predictor.predict(vect_text)
+				# Vectorize + predict, reusing the result if this text was seen before
+				with metrics.request("classify", model="Stochastic Gradient Descent (SGD)", input_size=len(tweet_text)):
+					prediction = prediction_cache.predict_texts("Stochastic Gradient Descent (SGD)", [tweet_text])
+				st.session_state["sgd_prediction"] = (tweet_text, prediction[0])
+
+			# When model has successfully run, will print prediction
+			# You can use a dictionary or similar structure to make this output
+			# more human interpretable.
+			# st.success("Text Categorized as: {}".format(prediction[0]))
+			if st.session_state.get("sgd_prediction", (None,))[0] == tweet_text:
+				predicted = st.session_state["sgd_prediction"][1]
+				st.success("Text Categorized as: {}".format(output[predicted]))
+
+				# Corrections are queued and learnt by the SGD model in the background
+				if online_learning.ENABLED:
+					with st.expander("Wrong label? Suggest the correct one"):
+						labels = list(output)
+						correct = st.selectbox("Correct label", labels, index=labels.index(predicted), format_func=output.get)
+						if st.button("Submit correction"):
+							online_learning.get_learner().submit(tweet_text, correct)
+							st.success("Thanks! The SGD model will learn from this shortly.")
+
+		if model == "Compare all models":
+			tweet_text = st.text_area("Enter text (Replace text below)", "CHECK OUT THESE WEATHER STORIES https://t.co/LwVzcPO30e Do Not believe the Global warming climate change stories sold by UN, Vatican &amp; Obama")
+			show_ensemble = st.checkbox("Add a majority-vote ensemble label", value=True)
+			if st.button("Classify"):
+				# Vectorize once and score with all three models in a single pass
+				with metrics.request("classify", model="compare", input_size=len(tweet_text)):
+					with metrics.timer("vectorize"):
+						vect_text = tweet_cv.transform([tweet_text])
+					stacked = inference.stack({name: registry.get(name) for name in MODEL_NAMES})
+					labels, scores = stacked.predict(vect_text, ensemble=show_ensemble, model_name="compare")
+
+				# Show each model's label next to its decision score for every class
+				comparison = pd.DataFrame(
+					[[output[labels[name][0]]] + list(scores[name][0]) for name in MODEL_NAMES],
+					index=MODEL_NAMES,
+					columns=["Label"] + ["{} score".format(output[c]) for c in stacked.classes_])
+				st.table(comparison)
+				if show_ensemble:
+					st.success("Text Categorized as: {} (majority vote)".format(output[labels[inference.ENSEMBLE][0]]))
+
+		# Nearest labelled training tweets, looked up in an inverted index over tweet_cv features
+		if os.path.exists(training_data.TRAIN_CSV) and st.checkbox("Show similar training tweets"):
+			k = st.slider("Number of similar tweets", 1, 20, 5)
+			matches = similar_tweets.similar(tweet_text, k)
+			if matches:
+				similar = pd.DataFrame(matches)[["sentiment", "similarity", "message"]]
+				similar.columns = ["Sentiment", "Similarity", "Tweet"]
+				st.table(similar)
+			else:
+				st.write("No training tweet shares a word with this text.")
 
-				# When model has successfully run, will print prediction
-				# You can use a dictionary or similar structure to make this output
-				# more human interpretable.
-				# st.success("Text Categorized as: {}".format(prediction[0]))
-				st.success("Text Categorized as: {}".format(output[prediction[0]]))
+		st.markdown("---")
+		st.info("📂 Classify a whole file of tweets (CSV or JSONL with a `message` column) using the model selected above. \"Compare all models\" labels each tweet by majority vote.")
+		uploaded = st.file_uploader("Upload tweets", type=["csv", "jsonl"])
+		if uploaded is not None and st.button("Classify file"):
+			extension = os.path.splitext(uploaded.name)[1].lower()
+			with tempfile.TemporaryDirectory() as tmp_dir:
+				input_path = os.path.join(tmp_dir, "tweets" + extension)
+				output_path = os.path.join(tmp_dir, "labels" + extension)
+				with open(input_path, "wb") as f:
+					shutil.copyfileobj(uploaded, f)
+				status = st.empty()
+				batch_model = inference.ENSEMBLE if model == "Compare all models" else model
+				with metrics.request("classify_file", model=batch_model, input_size=uploaded.size):
+					rows = batch_classify.classify_file(input_path, output_path, model=batch_model, workers=1,
+						progress=lambda done: status.text("{:,} tweets classified...".format(done)))
+				status.success("{:,} tweets classified".format(rows))
+				with open(output_path, "rb") as f:
+					st.download_button("Download labels", f.read(), file_name="labels" + extension)
 
 	if selection == "Models":
 		st.info("🤖 This section provides explanations of the three models we used. We also provide advantages and disadvantages of the models.")
 		st.markdown("The figure below shows the performances of the 11 models we trained. For this app, only the three best models were chosen. The three models are explained below.")
-		st.image("resources/imgs/figure_7.png")
+		show_image("resources/imgs/figure_7.png")
 		st.markdown("## 1️ LinearSVC (Support Vector Classifier)")
 		st.markdown("LinearSVC is a linear classification model based on Support Vector Machines (SVM). It aims to find a hyperplane that separates the data into different classes with the maximum margin.")
 		st.markdown("#### ✅ Advantages:")
@@ -277,7 +463,7 @@ def main():
 			st.write(" ")
 
 		with col2:
-			st.image("resources/imgs/new_Trendsetters_Analytics_Company_Logo.png")
+			show_image("resources/imgs/new_Trendsetters_Analytics_Company_Logo.png")
 
 		with col3:
 			st.write(" ")
@@ -288,7 +474,7 @@ def main():
 		col1, col2 = st.columns([1, 3])
 
 		with col1:
-			st.image("resources/imgs/edna.png", caption="Edna Mosima Kobo", width=200)
+			show_image("resources/imgs/edna.png", caption="Edna Mosima Kobo", width=200)
 
 		with col2:
 			st.write("Team leader and Project Manager - Oversees the project, coordinates team members, and ensures project goals are achieved.")
@@ -297,7 +483,7 @@ def main():
 		col1, col2 = st.columns([1, 3])
 
 		with col1:
-			st.image("resources/imgs/donald.png", caption="Donald Nkabinde", width=200)
+			show_image("resources/imgs/donald.png", caption="Donald Nkabinde", width=200)
 
 		with col2:
 			st.write("Vice team leader and Data Analyst - Assists the team leader, contributes to data analysis, and provides insights and recommendations.")
@@ -306,7 +492,7 @@ def main():
 		col1, col2 = st.columns([1, 3])
 
 		with col1:
-			st.image("resources/imgs/mmabatho.png", caption="Mmabatho Mojapelo", width=200)
+			show_image("resources/imgs/mmabatho.png", caption="Mmabatho Mojapelo", width=200)
 
 		with col2:
 			st.write("Time Management Specialist - Manages project timelines, deadlines, and task prioritization for efficient project progress.")
@@ -315,7 +501,7 @@ def main():
 		col1, col2 = st.columns([1, 3])
 
 		with col1:
-			st.image("resources/imgs/liz.png", caption="Makosha Elizabeth Lekganyane", width=200)
+			show_image("resources/imgs/liz.png", caption="Makosha Elizabeth Lekganyane", width=200)
 
 		with col2:
 			st.write("Quality Control Analyst - Ensures accuracy, reliability, and quality of data, models, and outcomes.")
@@ -324,7 +510,7 @@ def main():
 		col1, col2 = st.columns([1, 3])
 
 		with col1:
-			st.image("resources/imgs/khutso.png", caption="Khutso Madiga", width=200)
+			show_image("resources/imgs/khutso.png", caption="Khutso Madiga", width=200)
 
 		with col2:
 			st.write("Data Engineer - Responsible for data acquisition, preprocessing, integration, and storage for high-quality data analysis.")
@@ -333,7 +519,7 @@ def main():
 		col1, col2 = st.columns([1, 3])
 
 		with col1:
-			st.image("resources/imgs/tshepo.png", caption="Hawert Tshepo Hobyane", width=200)
+			show_image("resources/imgs/tshepo.png", caption="Hawert Tshepo Hobyane", width=200)
 
 		with col2:
 			st.write("Feature Engineer - Identifies and designs relevant features to enhance model performance.")
@@ -349,22 +535,8 @@ def main():
 	if selection == "Contact":
 		st.info("📞 Hi there, feel free to ask us anything. We will get back to you as soon as possible.")
 
-		csv_file = 'users.csv'
-		if os.path.exists(csv_file):
-			# read from file
-			results_option1 = pd.read_csv(csv_file, index_col=False)
-		else:
-			# create empty dataframe with the right columns & dtypes
-			results_option1 = pd.DataFrame(
-				{'time': np.array([]).astype('datetime64[ns]'),
-				'name': [],
-				'lastname': [],
-				'email': [],
-				"phone": [],
-				"method": [],
-				"message": [],
-				}
-			)
+		# Submissions are appended to the store; the existing history is never loaded here
+		store = submission_store.get_store()
 		with st.form(key = 'user_info'):
 			col1, col2 = st.columns(2)
 
@@ -387,13 +559,13 @@ def main():
 			if submit_form:		
 				if name and lastname and email and phone and preferrence and message:
 					timestamp = datetime.datetime.now()
-					results_option1.loc[len(results_option1)] = [timestamp, name, lastname, email, phone, preferrence, message]
-					results_option1.to_csv(csv_file, index=False)
-					# st.dataframe(results_option1)
+					store.append({"time": timestamp, "name": name, "lastname": lastname, "email": email,
+						"phone": phone, "method": preferrence, "message": message})
 					st.success("😁 Expect communication from us soon!")
 				else:
 					st.warning("Please fill all the fields")
 
 # Required to let Streamlit instantiate our web app.  
 if __name__ == '__main__':
-	main()
+	with metrics.timer("rerun"):
+		main()
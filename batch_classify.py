@@ -0,0 +1,270 @@
+"""
+
+    Bulk classification of tweets stored in CSV or JSONL files.
+
+    Description: The input file is streamed in bounded chunks, each chunk is
+	vectorized with ``tweet_cv`` and scored in a pool of worker processes,
+	and the labels are appended to the output file as soon as they are
+	ready. Only a handful of chunks are ever in flight, so memory use stays
+	flat regardless of the size of the input.
+
+	A small checkpoint file (``<output>.progress``) is rewritten after every
+	chunk. Running again with ``--resume`` truncates the output to the last
+	checkpoint and carries on from the next unprocessed row; it refuses to
+	resume a run started on a different input file, model or id field.
+
+    Usage:
+
+	python batch_classify.py tweets.csv labels.csv --model sgd --workers 4
+	python batch_classify.py tweets.jsonl labels.jsonl --resume
+
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+import compact_model
+import inference
+import prediction_cache
+from model_registry import registry, resolve_model_name, MODEL_ALIASES, MODEL_NAMES, VECTORIZER
+
+DEFAULT_CHUNK_SIZE = 10000
+DEFAULT_TEXT_FIELD = "message"
+
+
+def _is_jsonl(path):
+	return os.path.splitext(path)[1].lower() in (".jsonl", ".json", ".ndjson")
+
+
+def iter_records(path, text_field=DEFAULT_TEXT_FIELD, id_field=None, skip=0):
+	"""Yield ``(id, text)`` for every row of a CSV or JSONL file, after ``skip`` rows."""
+	with open(path, newline="", encoding="utf-8") as f:
+		if _is_jsonl(path):
+			rows = (json.loads(line) for line in f if line.strip())
+		else:
+			rows = csv.DictReader(f)
+		for row in itertools.islice(rows, skip, None):
+			text = row.get(text_field)
+			yield (row.get(id_field) if id_field else None), ("" if text is None else str(text))
+
+
+def iter_chunks(records, chunk_size=DEFAULT_CHUNK_SIZE):
+	"""Group ``records`` into lists of at most ``chunk_size`` items."""
+	records = iter(records)
+	while True:
+		chunk = list(itertools.islice(records, chunk_size))
+		if not chunk:
+			return
+		yield chunk
+
+
+def _resolve(model):
+	if model == inference.ENSEMBLE or model.lower() == "ensemble":
+		return inference.ENSEMBLE
+	return resolve_model_name(model)
+
+
+def _artifacts(model_name):
+	"""Registry entries needed to score with ``model_name``."""
+	if model_name == inference.ENSEMBLE:
+		return [VECTORIZER] + MODEL_NAMES
+	return [VECTORIZER, model_name]
+
+
+def _init_worker(model_name):
+	# With the fork start method the parent's loaded artifacts are inherited
+	# copy-on-write, so this is a no-op; under spawn it loads them once.
+	registry.warm_up(_artifacts(model_name))
+
+
+def classify_texts(model_name, texts):
+	"""Return the numeric sentiment of each text, reusing cached predictions."""
+	return prediction_cache.predict_texts(model_name, list(texts))
+
+
+# Memory-mapped bundle opened by each worker when --compact is used
+_bundle = None
+
+
+def _init_compact_worker(directory):
+	global _bundle
+	_bundle = compact_model.CompactBundle(directory)
+
+
+def classify_texts_compact(directory, model_name, texts):
+	"""Like :func:`classify_texts`, but scored from a compact bundle without sklearn."""
+	global _bundle
+	if _bundle is None or _bundle.directory != directory:
+		_init_compact_worker(directory)
+	if model_name == inference.ENSEMBLE:
+		labels = _bundle.predict_all(texts)
+		return inference.majority_vote([labels[name] for name in MODEL_NAMES]).tolist()
+	return _bundle.predict(model_name, texts).tolist()
+
+
+class _Checkpoint:
+	"""Rows done and output size, rewritten atomically after every chunk."""
+
+	def __init__(self, path):
+		self.path = path
+
+	def load(self):
+		try:
+			with open(self.path) as f:
+				return json.load(f)
+		except FileNotFoundError:
+			return None
+
+	def save(self, **state):
+		tmp = self.path + ".tmp"
+		with open(tmp, "w") as f:
+			json.dump(state, f)
+		os.replace(tmp, self.path)
+
+	def clear(self):
+		if os.path.exists(self.path):
+			os.remove(self.path)
+
+
+class _Writer:
+	"""Appends labelled rows to a CSV or JSONL output file."""
+
+	def __init__(self, f, jsonl, with_id):
+		self.f = f
+		self.jsonl = jsonl
+		self.with_id = with_id
+		self.csv = None if jsonl else csv.writer(f)
+
+	def header(self):
+		if not self.jsonl:
+			self.csv.writerow((["id"] if self.with_id else []) + ["row", "sentiment", "label"])
+
+	def write(self, start, ids, sentiments):
+		for offset, (row_id, sentiment) in enumerate(zip(ids, sentiments)):
+			row = start + offset
+			label = inference.LABELS.get(sentiment, str(sentiment))
+			if self.jsonl:
+				record = {"row": row, "sentiment": sentiment, "label": label}
+				if self.with_id:
+					record["id"] = row_id
+				self.f.write(json.dumps(record) + "\n")
+			else:
+				self.csv.writerow(([row_id] if self.with_id else []) + [row, sentiment, label])
+
+
+def classify_file(input_path, output_path, model="LinearSVC", text_field=DEFAULT_TEXT_FIELD,
+		id_field=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=None, resume=False, progress=None,
+		compact_dir=None):
+	"""Label every row of ``input_path`` and write the results to ``output_path``.
+
+	``workers`` of 0 or 1 classifies in-process. ``progress`` is called with
+	the number of rows done after each chunk is written. Returns that count.
+	With ``compact_dir`` the models are read from a memory-mapped bundle
+	exported by ``compact_model.py`` instead of the pickles.
+	"""
+	model_name = _resolve(model)
+	if compact_dir:
+		score = functools.partial(classify_texts_compact, compact_dir)
+		initializer, initargs = _init_compact_worker, (compact_dir,)
+	else:
+		# Load once in the parent so forked workers share the pages
+		registry.warm_up(_artifacts(model_name))
+		score = classify_texts
+		initializer, initargs = _init_worker, (model_name,)
+
+	checkpoint = _Checkpoint(output_path + ".progress")
+	run = {"input": os.path.abspath(input_path), "model": model_name, "id_field": id_field}
+	state = checkpoint.load() if resume else None
+	if state:
+		changed = [key for key, value in run.items() if key in state and state[key] != value]
+		if changed:
+			raise ValueError("cannot resume {}: it was started with a different {} ({})".format(
+				output_path, " and ".join(changed), ", ".join(repr(state[key]) for key in changed)))
+	if state and os.path.exists(output_path):
+		done = state["rows_done"]
+		f = open(output_path, "r+", newline="", encoding="utf-8")
+		f.truncate(state["output_bytes"])
+		f.seek(state["output_bytes"])
+	else:
+		done = 0
+		f = open(output_path, "w", newline="", encoding="utf-8")
+
+	writer = _Writer(f, _is_jsonl(output_path), id_field is not None)
+	chunks = iter_chunks(iter_records(input_path, text_field, id_field, skip=done), chunk_size)
+
+	def emit(start, ids, sentiments):
+		nonlocal done
+		writer.write(start, ids, sentiments)
+		f.flush()
+		os.fsync(f.fileno())
+		done = start + len(sentiments)
+		checkpoint.save(rows_done=done, output_bytes=f.tell(), **run)
+		if progress:
+			progress(done)
+
+	with f:
+		if done == 0:
+			writer.header()
+		start = done
+		if not workers or workers <= 1:
+			for chunk in chunks:
+				ids, texts = zip(*chunk)
+				emit(start, ids, score(model_name, texts))
+				start += len(chunk)
+		else:
+			# Keep at most two chunks per worker in flight to bound memory
+			with ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs) as pool:
+				pending = []
+				for chunk in chunks:
+					ids, texts = zip(*chunk)
+					pending.append((start, ids, pool.submit(score, model_name, texts)))
+					start += len(chunk)
+					while len(pending) >= 2 * workers:
+						s, i, future = pending.pop(0)
+						emit(s, i, future.result())
+				for s, i, future in pending:
+					emit(s, i, future.result())
+
+	checkpoint.clear()
+	return done
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Classify the tweets in a CSV or JSONL file.")
+	parser.add_argument("input", help="CSV or JSONL file with one tweet per row")
+	parser.add_argument("output", help="where to write the labels (.csv or .jsonl)")
+	parser.add_argument("--model", default="lsvc",
+		help="model to use: {}, ensemble (majority vote of all three) or a full registry name".format(
+			", ".join(MODEL_ALIASES)))
+	parser.add_argument("--text-field", default=DEFAULT_TEXT_FIELD, help="column/key holding the tweet text")
+	parser.add_argument("--id-field", help="column/key copied to the output to identify each row")
+	parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+	parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (1 = in-process)")
+	parser.add_argument("--resume", action="store_true", help="continue from the last checkpoint")
+	parser.add_argument("--compact", metavar="DIR", nargs="?", const=compact_model.DEFAULT_DIR,
+		help="score from a compact bundle (see compact_model.py) instead of the pickles")
+	args = parser.parse_args(argv)
+
+	started = time.time()
+
+	def report(done):
+		rate = done / max(time.time() - started, 1e-9)
+		print("\r{:,} rows classified ({:,.0f} rows/s)".format(done, rate), end="", file=sys.stderr, flush=True)
+
+	try:
+		done = classify_file(args.input, args.output, model=args.model, text_field=args.text_field,
+			id_field=args.id_field, chunk_size=args.chunk_size, workers=args.workers,
+			resume=args.resume, progress=report, compact_dir=args.compact)
+	except ValueError as e:
+		parser.error(str(e))
+	print("\nWrote {:,} labels to {}".format(done, args.output), file=sys.stderr)
+
+
+if __name__ == "__main__":
+	main()
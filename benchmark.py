@@ -0,0 +1,265 @@
+"""
+
+    Benchmarks for startup, artifact loading, vectorizing and predicting.
+
+    Description: Runs against a synthetic tweet corpus generated from a fixed
+	seed (words are drawn from the vectorizer's own vocabulary mixed with
+	hashtags, mentions, links and out-of-vocabulary tokens), so results are
+	reproducible offline and comparable between machines, model swaps in
+	``resources/`` and library upgrades. Each timing is the median of
+	``--repeat`` runs.
+
+	Stages:
+
+	- ``startup``: fresh interpreter importing the app's model dependencies
+	- ``load``: ``joblib.load`` of ``vect.pkl`` and every ``final_*.pkl``
+	- ``vectorize``: ``tweet_cv.transform`` per batch size
+	- ``predict``: sparse scoring (``inference.predict``) per model and batch size
+
+    Usage:
+
+	python benchmark.py run --out bench.json
+	python benchmark.py compare bench.json baseline.json --threshold 0.2
+
+	Peak RSS is measured in a fresh process per stage (``load``: every
+	artifact loaded; ``batch_<n>``: loaded, then one batch of ``n`` tweets
+	vectorized and scored by every model), because ``ru_maxrss`` is a
+	high-water mark for the whole life of a process.
+
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+try:
+	import resource
+except ImportError:  # Windows
+	resource = None
+
+import joblib
+import numpy as np
+
+import inference
+from model_registry import registry, DEFAULT_ARTIFACTS, MODEL_NAMES, VECTORIZER
+
+BATCH_SIZES = [1, 10, 100, 1000, 10000, 100000]
+SEED = 2023
+
+
+def peak_rss_mb():
+	"""Peak resident set size of this process so far, in MB."""
+	if resource is None:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# Linux reports kilobytes, macOS bytes
+	return round(peak / (1024.0 * 1024 if sys.platform == "darwin" else 1024.0), 1)
+
+
+def synthetic_corpus(vocabulary, size, seed=SEED):
+	"""Return ``size`` tweet-like strings built deterministically from ``vocabulary``."""
+	rng = random.Random(seed)
+	words = sorted(term for term in vocabulary if " " not in term)
+	extras = ["#climate", "#climatechange", "#BeforeTheFlood", "@realDonaldTrump", "RT", "&amp;"]
+	tweets = []
+	for _ in range(size):
+		tokens = [rng.choice(words) for _ in range(rng.randint(5, 25))]
+		for _ in range(rng.randint(0, 3)):
+			tokens.insert(rng.randrange(len(tokens) + 1), rng.choice(extras))
+		if rng.random() < 0.5:
+			tokens.append("https://t.co/" + "".join(rng.choice("abcdefghijkLMNOPQ0123456789") for _ in range(10)))
+		if rng.random() < 0.2:
+			tokens.insert(0, "zq{}xv".format(rng.randrange(10 ** 6)))
+		tweets.append(" ".join(tokens))
+	return tweets
+
+
+def _time(fn, repeat):
+	timings = []
+	for _ in range(repeat):
+		started = time.perf_counter()
+		fn()
+		timings.append(time.perf_counter() - started)
+	return {"median_s": statistics.median(timings), "min_s": min(timings), "runs": repeat}
+
+
+def bench_startup(repeat):
+	"""Time a fresh interpreter importing the model stack and loading every artifact."""
+	code = "import inference, model_registry; model_registry.registry.warm_up()"
+	here = os.path.dirname(os.path.abspath(__file__))
+	return _time(lambda: subprocess.run([sys.executable, "-W", "ignore", "-c", code], cwd=here, check=True), repeat)
+
+
+def bench_load(repeat):
+	results = {}
+	for name, filename in DEFAULT_ARTIFACTS.items():
+		path = os.path.join(registry.resources_dir, filename)
+
+		def load():
+			with open(path, "rb") as f:
+				joblib.load(f)
+
+		results[filename] = dict(_time(load, repeat), size_bytes=os.path.getsize(path))
+	return results
+
+
+_RSS_CODE = """
+import sys
+import benchmark, inference
+from model_registry import registry, MODEL_NAMES, VECTORIZER
+registry.warm_up()
+size = int(sys.argv[1])
+if size:
+	vectorizer = registry.get(VECTORIZER)
+	X = vectorizer.transform(benchmark.synthetic_corpus(vectorizer.vocabulary_, size))
+	for name in MODEL_NAMES:
+		inference.predict(registry.get(name), X, name)
+print(benchmark.peak_rss_mb())
+"""
+
+
+def bench_peak_rss(batch_sizes):
+	"""Peak RSS in MB of a fresh process per stage: artifacts loaded, then one batch of each size."""
+	if resource is None:
+		return {}
+	here = os.path.dirname(os.path.abspath(__file__))
+	results = {}
+	for key, size in [("load", 0)] + [("batch_{}".format(size), size) for size in batch_sizes]:
+		out = subprocess.run([sys.executable, "-W", "ignore", "-c", _RSS_CODE, str(size)],
+			cwd=here, check=True, capture_output=True, text=True).stdout
+		results[key] = float(out.split()[-1])
+	return results
+
+
+def run(batch_sizes=BATCH_SIZES, repeat=5, include_startup=True, include_rss=True):
+	"""Run every stage and return the results as a JSON-serializable dict."""
+	results = {
+		"meta": {
+			"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+			"python": platform.python_version(),
+			"platform": platform.platform(),
+			"numpy": np.__version__,
+			"batch_sizes": batch_sizes,
+			"repeat": repeat,
+			"seed": SEED,
+		},
+		"stages": {},
+		"peak_rss_mb": {},
+	}
+	try:
+		import sklearn
+		results["meta"]["sklearn"] = sklearn.__version__
+	except ImportError:
+		pass
+
+	stages = results["stages"]
+	if include_startup:
+		stages["startup"] = bench_startup(max(1, min(repeat, 3)))
+	stages["load"] = bench_load(max(1, min(repeat, 3)))
+	if include_rss:
+		results["peak_rss_mb"] = bench_peak_rss(batch_sizes)
+
+	registry.warm_up()
+	results["meta"]["artifacts"] = {name: registry.checksum(name) for name in registry.names()}
+	vectorizer = registry.get(VECTORIZER)
+	corpus = synthetic_corpus(vectorizer.vocabulary_, max(batch_sizes))
+
+	stages["vectorize"], stages["predict"] = {}, {name: {} for name in MODEL_NAMES}
+	for size in batch_sizes:
+		texts = corpus[:size]
+		# Fewer repeats for the big batches keeps the whole run to a few minutes
+		runs = repeat if size <= 1000 else max(1, repeat // 2)
+		stages["vectorize"][str(size)] = _time(lambda: vectorizer.transform(texts), runs)
+		X = vectorizer.transform(texts)
+		for name in MODEL_NAMES:
+			model = registry.get(name)
+			stages["predict"][name][str(size)] = _time(lambda: inference.predict(model, X, name), runs)
+	return results
+
+
+def _flatten(stages, prefix=""):
+	"""Yield ``(stage path, median seconds)`` for every timing in ``stages``."""
+	for key, value in stages.items():
+		path = prefix + "/" + key if prefix else key
+		if isinstance(value, dict) and "median_s" in value:
+			yield path, value["median_s"]
+		elif isinstance(value, dict):
+			yield from _flatten(value, path)
+
+
+def compare(current, baseline, threshold=0.2, min_seconds=1e-4, min_mb=5.0):
+	"""Return ``(stage, baseline, current, ratio)`` for every timing or peak RSS above ``1 + threshold``.
+
+	Timings below ``min_seconds`` in both runs, and RSS growth under
+	``min_mb``, are ignored as noise. Peak RSS stages are reported as
+	``peak_rss_mb/<stage>``.
+	"""
+	base = dict(_flatten(baseline["stages"]))
+	regressions = []
+	for path, seconds in _flatten(current["stages"]):
+		before = base.get(path)
+		if before is None or max(before, seconds) < min_seconds:
+			continue
+		ratio = seconds / before if before else float("inf")
+		if ratio > 1 + threshold:
+			regressions.append((path, before, seconds, ratio))
+	base_rss = baseline.get("peak_rss_mb") or {}
+	for stage, mb in sorted((current.get("peak_rss_mb") or {}).items()):
+		before = base_rss.get(stage)
+		if before is None or mb is None or mb - before < min_mb:
+			continue
+		ratio = mb / before if before else float("inf")
+		if ratio > 1 + threshold:
+			regressions.append(("peak_rss_mb/" + stage, before, mb, ratio))
+	return regressions
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Benchmark the tweet classification pipeline.")
+	sub = parser.add_subparsers(dest="command", required=True)
+	p = sub.add_parser("run", help="run the benchmarks and write JSON results")
+	p.add_argument("--out", default="bench.json")
+	p.add_argument("--repeat", type=int, default=5)
+	p.add_argument("--max-batch", type=int, default=max(BATCH_SIZES), help="largest batch size to run")
+	p.add_argument("--no-startup", action="store_true", help="skip the subprocess startup benchmark")
+	p.add_argument("--no-rss", action="store_true", help="skip the per-stage peak RSS subprocesses")
+	p.add_argument("--baseline", help="also compare against this results file")
+	p.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging, e.g. 0.2 = 20%%")
+	p = sub.add_parser("compare", help="flag regressions of one results file against a baseline")
+	p.add_argument("current")
+	p.add_argument("baseline")
+	p.add_argument("--threshold", type=float, default=0.2)
+	args = parser.parse_args(argv)
+
+	if args.command == "run":
+		sizes = [size for size in BATCH_SIZES if size <= args.max_batch]
+		current = run(sizes, args.repeat, include_startup=not args.no_startup, include_rss=not args.no_rss)
+		with open(args.out, "w") as f:
+			json.dump(current, f, indent=2)
+		print("Wrote {}".format(args.out))
+		if not args.baseline:
+			return
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+	else:
+		with open(args.current) as f:
+			current = json.load(f)
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+
+	regressions = compare(current, baseline, args.threshold)
+	for path, before, after, ratio in regressions:
+		value = "{:.1f} MB" if path.startswith("peak_rss_mb/") else "{:.4f}s"
+		print("REGRESSION {}: {} -> {} ({:+.0%})".format(path, value.format(before), value.format(after), ratio - 1))
+	if regressions:
+		sys.exit(1)
+	print("No regressions beyond {:.0%}".format(args.threshold))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,312 @@
+"""
+
+    Compact, memory-mappable export of the vectorizer and linear models.
+
+    Description: The pickled vectorizer and classifiers have to be fully
+	unpickled (and sklearn imported) by every process before the first
+	prediction. This module exports everything prediction needs into plain
+	numpy arrays:
+
+	- ``vocab_bytes.npy`` / ``vocab_offsets.npy``: the UTF-8 encoded terms,
+	  ordered by feature index
+	- ``vocab_table.npy``: an open-addressing hash table mapping terms to
+	  feature indices
+	- ``idf.npy``: the IDF weights, for TF-IDF vectorizers only
+	- ``model_<n>.coef_t.npy``: each model's transposed ``coef_``
+	- ``meta.json``: tokenizer settings, classes, intercepts and the
+	  checksums of the source pickles
+
+	:class:`CompactBundle` loads these with ``mmap_mode="r"``, so opening a
+	bundle is almost free, only the pages touched by a prediction are read,
+	and every worker process shares the same pages through the OS page
+	cache. Loading and predicting needs numpy only, not sklearn.
+
+    Usage:
+
+	python compact_model.py export              # writes resources/compact/
+	python compact_model.py verify              # parity check against the pickles
+	python compact_model.py predict "some tweet" --model sgd
+
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+FORMAT_VERSION = 1
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "compact")
+
+_EMPTY = -1
+
+
+def _term_hash(term_bytes):
+	return int.from_bytes(hashlib.blake2b(term_bytes, digest_size=8).digest(), "little")
+
+
+def _build_table(encoded_terms):
+	"""Open-addressing (linear probing) hash table of feature indices, load factor <= 0.5."""
+	size = 1
+	while size < 2 * len(encoded_terms):
+		size <<= 1
+	mask = size - 1
+	table = np.full(size, _EMPTY, dtype=np.int32)
+	for index, term in enumerate(encoded_terms):
+		slot = _term_hash(term) & mask
+		while table[slot] != _EMPTY:
+			slot = (slot + 1) & mask
+		table[slot] = index
+	return table
+
+
+def export(vectorizer, models, out_dir=DEFAULT_DIR, sources=None):
+	"""Write ``vectorizer`` and the ``{name: model}`` linear models to ``out_dir``.
+
+	``sources`` optionally maps artifact names to the checksums of the
+	pickles they came from, recorded for traceability.
+	"""
+	params = vectorizer.get_params()
+	if params.get("analyzer") != "word" or params.get("tokenizer") or params.get("preprocessor") \
+			or params.get("strip_accents"):
+		raise ValueError("Only word analyzers with the default tokenizer and preprocessor can be exported")
+
+	os.makedirs(out_dir, exist_ok=True)
+	vocabulary = vectorizer.vocabulary_
+	terms = [None] * len(vocabulary)
+	for term, index in vocabulary.items():
+		terms[index] = term.encode("utf-8")
+	offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+	np.cumsum([len(t) for t in terms], out=offsets[1:])
+	np.save(os.path.join(out_dir, "vocab_bytes.npy"), np.frombuffer(b"".join(terms), dtype=np.uint8))
+	np.save(os.path.join(out_dir, "vocab_offsets.npy"), offsets)
+	np.save(os.path.join(out_dir, "vocab_table.npy"), _build_table(terms))
+
+	has_idf = hasattr(vectorizer, "idf_")
+	if has_idf:
+		np.save(os.path.join(out_dir, "idf.npy"), np.asarray(vectorizer.idf_, dtype=np.float64))
+
+	stop_words = params.get("stop_words")
+	if stop_words is not None and not isinstance(stop_words, str):
+		stop_words = sorted(stop_words)
+	elif stop_words is not None:
+		stop_words = sorted(vectorizer.get_stop_words())
+
+	meta = {
+		"format_version": FORMAT_VERSION,
+		"vectorizer": {
+			"n_features": len(terms),
+			"lowercase": params["lowercase"],
+			"token_pattern": params["token_pattern"],
+			"ngram_range": list(params["ngram_range"]),
+			"binary": params["binary"],
+			"stop_words": stop_words,
+			"idf": has_idf,
+			"norm": params.get("norm") if has_idf else None,
+			"sublinear_tf": params.get("sublinear_tf", False) if has_idf else False,
+		},
+		"models": [],
+		"sources": sources or {},
+	}
+	for i, (name, model) in enumerate(models.items()):
+		filename = "model_{}.coef_t.npy".format(i)
+		np.save(os.path.join(out_dir, filename), np.ascontiguousarray(np.asarray(model.coef_, dtype=np.float64).T))
+		meta["models"].append({
+			"name": name,
+			"type": type(model).__name__,
+			"coef_file": filename,
+			"intercept": np.asarray(model.intercept_, dtype=np.float64).ravel().tolist(),
+			"classes": np.asarray(model.classes_).tolist(),
+		})
+	with open(os.path.join(out_dir, "meta.json"), "w") as f:
+		json.dump(meta, f, indent=1)
+	return meta
+
+
+class CompactVectorizer:
+	"""Bag-of-ngrams tokenizer equivalent to the exported CountVectorizer/TfidfVectorizer."""
+
+	def __init__(self, directory, meta):
+		self.meta = meta
+		self._bytes = np.load(os.path.join(directory, "vocab_bytes.npy"), mmap_mode="r")
+		self._offsets = np.load(os.path.join(directory, "vocab_offsets.npy"), mmap_mode="r")
+		self._table = np.load(os.path.join(directory, "vocab_table.npy"), mmap_mode="r")
+		self._mask = len(self._table) - 1
+		self._idf = np.load(os.path.join(directory, "idf.npy"), mmap_mode="r") if meta["idf"] else None
+		self._token = re.compile(meta["token_pattern"])
+		self._stop_words = frozenset(meta["stop_words"] or ())
+		self.n_features = meta["n_features"]
+
+	def lookup(self, term):
+		"""Return the feature index of ``term`` or ``None`` if it is not in the vocabulary."""
+		encoded = term.encode("utf-8")
+		slot = _term_hash(encoded) & self._mask
+		while True:
+			index = int(self._table[slot])
+			if index == _EMPTY:
+				return None
+			start, stop = self._offsets[index], self._offsets[index + 1]
+			if stop - start == len(encoded) and self._bytes[start:stop].tobytes() == encoded:
+				return index
+			slot = (slot + 1) & self._mask
+
+	def _ngrams(self, text):
+		if self.meta["lowercase"]:
+			text = text.lower()
+		tokens = [t for t in self._token.findall(text) if t not in self._stop_words]
+		min_n, max_n = self.meta["ngram_range"]
+		for n in range(min_n, max_n + 1):
+			for i in range(len(tokens) - n + 1):
+				yield tokens[i] if n == 1 else " ".join(tokens[i:i + n])
+
+	def transform(self, texts):
+		"""Return ``(indptr, indices, data)`` CSR arrays for ``texts``."""
+		indptr, indices, data = [0], [], []
+		for text in texts:
+			counts = {}
+			for gram in self._ngrams(text):
+				index = self.lookup(gram)
+				if index is not None:
+					counts[index] = counts.get(index, 0) + 1
+			indices.extend(counts)
+			data.extend(counts.values())
+			indptr.append(len(indices))
+		indptr = np.asarray(indptr, dtype=np.int64)
+		indices = np.asarray(indices, dtype=np.int64)
+		data = np.asarray(data, dtype=np.float64)
+		if self.meta["binary"]:
+			data[:] = 1.0
+		if self._idf is not None:
+			if self.meta["sublinear_tf"]:
+				data = np.log(data) + 1.0
+			data *= self._idf[indices]
+			if self.meta["norm"]:
+				rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+				norms = np.zeros(len(indptr) - 1)
+				np.add.at(norms, rows, np.abs(data) if self.meta["norm"] == "l1" else data ** 2)
+				if self.meta["norm"] == "l2":
+					norms = np.sqrt(norms)
+				norms[norms == 0] = 1.0
+				data /= norms[rows]
+		return indptr, indices, data
+
+
+class CompactModel:
+	"""A linear classifier backed by a memory-mapped coefficient matrix."""
+
+	def __init__(self, directory, meta):
+		self.name = meta["name"]
+		self.coef_t = np.load(os.path.join(directory, meta["coef_file"]), mmap_mode="r")
+		self.intercept_ = np.asarray(meta["intercept"])
+		self.classes_ = np.asarray(meta["classes"])
+
+	def decision_scores(self, features):
+		"""Decision scores for the ``(indptr, indices, data)`` returned by the vectorizer."""
+		indptr, indices, data = features
+		scores = np.zeros((len(indptr) - 1, self.coef_t.shape[1]))
+		if len(indices):
+			rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+			np.add.at(scores, rows, self.coef_t[indices] * data[:, None])
+		scores += self.intercept_
+		return scores
+
+	def predict(self, features):
+		scores = self.decision_scores(features)
+		if scores.shape[1] == 1:
+			return self.classes_[(scores[:, 0] > 0).astype(int)]
+		return self.classes_[scores.argmax(axis=1)]
+
+
+class CompactBundle:
+	"""The exported vectorizer and every exported model, opened read-only."""
+
+	def __init__(self, directory=DEFAULT_DIR):
+		with open(os.path.join(directory, "meta.json")) as f:
+			self.meta = json.load(f)
+		if self.meta.get("format_version") != FORMAT_VERSION:
+			raise ValueError("Unsupported compact model format version {}".format(self.meta.get("format_version")))
+		self.directory = directory
+		self.vectorizer = CompactVectorizer(directory, self.meta["vectorizer"])
+		self.models = {m["name"]: CompactModel(directory, m) for m in self.meta["models"]}
+
+	def predict(self, model_name, texts):
+		"""Return the predicted class of each text using ``model_name``."""
+		return self.models[model_name].predict(self.vectorizer.transform(texts))
+
+	def predict_all(self, texts):
+		"""Vectorize ``texts`` once and return ``{model name: predicted classes}``."""
+		features = self.vectorizer.transform(texts)
+		return {name: model.predict(features) for name, model in self.models.items()}
+
+
+def _export_registry(out_dir):
+	from model_registry import registry, MODEL_NAMES, VECTORIZER
+	names = [VECTORIZER] + MODEL_NAMES
+	return export(registry.get(VECTORIZER), {name: registry.get(name) for name in MODEL_NAMES}, out_dir,
+		sources={name: registry.checksum(name) for name in names})
+
+
+def verify(directory=DEFAULT_DIR, texts=None):
+	"""Compare bundle predictions with the pickled models; returns ``{model: mismatches}``."""
+	from model_registry import registry, MODEL_NAMES, VECTORIZER
+	import inference
+	bundle = CompactBundle(directory)
+	vectorizer = registry.get(VECTORIZER)
+	mismatches = {}
+	for name in MODEL_NAMES:
+		expected = inference.predict_texts(registry.get(name), vectorizer, texts, model_name=name)
+		actual = bundle.predict(name, texts)
+		mismatches[name] = int((expected != actual).sum())
+	return mismatches
+
+
+def _verification_texts(path, limit):
+	import csv
+	if path and os.path.exists(path):
+		with open(path, newline="", encoding="utf-8") as f:
+			return [row["message"] for _, row in zip(range(limit), csv.DictReader(f))]
+	from load_test import SAMPLE_TWEETS
+	return list(SAMPLE_TWEETS) + ["", "Climate  CHANGE is real!!", "ünïcödé tweet about #climate"]
+
+
+def _alias(name):
+	from model_registry import resolve_model_name
+	return resolve_model_name(name)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Export and use the compact model format.")
+	sub = parser.add_subparsers(dest="command", required=True)
+	p = sub.add_parser("export", help="export resources/*.pkl to the compact format")
+	p.add_argument("--out", default=DEFAULT_DIR)
+	p = sub.add_parser("verify", help="check the compact bundle predicts exactly like the pickles")
+	p.add_argument("--dir", default=DEFAULT_DIR)
+	p.add_argument("--texts", default=os.path.join("resources", "train.csv"), help="CSV with a 'message' column")
+	p.add_argument("--limit", type=int, default=20000)
+	p = sub.add_parser("predict", help="classify tweets using only the compact bundle")
+	p.add_argument("texts", nargs="+")
+	p.add_argument("--dir", default=DEFAULT_DIR)
+	p.add_argument("--model", default="LinearSVC")
+	args = parser.parse_args(argv)
+
+	if args.command == "export":
+		meta = _export_registry(args.out)
+		print("Exported {} features and {} models to {}".format(
+			meta["vectorizer"]["n_features"], len(meta["models"]), args.out))
+	elif args.command == "verify":
+		texts = _verification_texts(args.texts, args.limit)
+		mismatches = verify(args.dir, texts)
+		for name, count in mismatches.items():
+			print("{}: {} / {} predictions differ".format(name, count, len(texts)))
+		sys.exit(1 if any(mismatches.values()) else 0)
+	else:
+		bundle = CompactBundle(args.dir)
+		model = args.model if args.model in bundle.models else _alias(args.model)
+		for text, label in zip(args.texts, bundle.predict(model, args.texts)):
+			print("{}\t{}".format(label, text))
+
+
+if __name__ == "__main__":
+	main()
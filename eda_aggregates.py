@@ -0,0 +1,196 @@
+"""
+
+    Precomputed EDA summaries of the training tweets.
+
+    Description: A single streaming pass over ``resources/train.csv`` builds
+	small summaries - class counts, tweet-length histograms per sentiment
+	and hashtag/mention counts per sentiment - which are persisted to
+	``resources/.cache/eda_summary.json``. The EDA page draws its charts
+	from these summaries without loading the raw data.
+
+	The byte offset reached by the last pass and a sha256 of every byte
+	before it are stored with the summary. When rows are appended to the
+	CSV only the new bytes are parsed and merged in; if any of the
+	already-processed bytes changed, the summary is rebuilt from scratch.
+
+    Usage:
+
+	python eda_aggregates.py            # build or update the summary
+
+"""
+import collections
+import csv
+import hashlib
+import json
+import os
+import re
+import threading
+
+from metrics import timer
+from model_registry import RESOURCES_DIR
+
+TRAIN_CSV = os.path.join(RESOURCES_DIR, "train.csv")
+SUMMARY_PATH = os.path.join(RESOURCES_DIR, ".cache", "eda_summary.json")
+SUMMARY_VERSION = 2
+
+LENGTH_BIN = 10
+LENGTH_BINS = 32  # the last bin collects everything of 310+ characters
+
+_HASHTAG = re.compile(r"#\w+")
+_MENTION = re.compile(r"@\w+")
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def _empty_summary():
+	return {
+		"version": SUMMARY_VERSION,
+		"offset": 0,
+		"fingerprint": None,
+		"columns": None,
+		"rows": 0,
+		"class_counts": {},
+		"length_histograms": {},
+		"hashtags": {},
+		"mentions": {},
+	}
+
+
+def _fingerprint(path, offset):
+	"""Hash every byte of the already-processed part of the file."""
+	digest = hashlib.sha256()
+	with open(path, "rb") as f:
+		remaining = offset
+		while remaining:
+			chunk = f.read(min(remaining, 1 << 20))
+			if not chunk:
+				break
+			digest.update(chunk)
+			remaining -= len(chunk)
+	return digest.hexdigest()
+
+
+def _lines(f, end):
+	"""Yield decoded lines from the current position of binary ``f`` up to byte ``end``."""
+	position = f.tell()
+	for line in f:
+		if position >= end:
+			return
+		position += len(line)
+		yield line.decode("utf-8", errors="replace")
+
+
+def _complete_end(path, size):
+	"""Byte offset just past the last newline, so a half-written last row is left for later."""
+	with open(path, "rb") as f:
+		start = max(0, size - 64 * 1024)
+		while True:
+			f.seek(start)
+			chunk = f.read(size - start)
+			newline = chunk.rfind(b"\n")
+			if newline >= 0:
+				return start + newline + 1
+			if start == 0:
+				return 0
+			start = max(0, start - 64 * 1024)
+
+
+def _accumulate(summary, path, start, end):
+	"""Fold the rows between byte offsets ``start`` and ``end`` into ``summary``."""
+	classes = collections.Counter(summary["class_counts"])
+	lengths = {k: list(v) for k, v in summary["length_histograms"].items()}
+	hashtags = {k: collections.Counter(v) for k, v in summary["hashtags"].items()}
+	mentions = {k: collections.Counter(v) for k, v in summary["mentions"].items()}
+
+	with open(path, "rb") as f:
+		f.seek(start)
+		reader = csv.reader(_lines(f, end))
+		if summary["columns"] is None:
+			header = next(reader)
+			summary["columns"] = {"sentiment": header.index("sentiment"), "message": header.index("message")}
+		sentiment_col = summary["columns"]["sentiment"]
+		message_col = summary["columns"]["message"]
+		rows = 0
+		for row in reader:
+			if len(row) <= max(sentiment_col, message_col):
+				continue
+			label, message = row[sentiment_col], row[message_col]
+			rows += 1
+			classes[label] += 1
+			histogram = lengths.setdefault(label, [0] * LENGTH_BINS)
+			histogram[min(len(message) // LENGTH_BIN, LENGTH_BINS - 1)] += 1
+			hashtags.setdefault(label, collections.Counter()).update(t.lower() for t in _HASHTAG.findall(message))
+			mentions.setdefault(label, collections.Counter()).update(m.lower() for m in _MENTION.findall(message))
+
+	summary.update(
+		rows=summary["rows"] + rows,
+		class_counts=dict(classes),
+		length_histograms=lengths,
+		hashtags={k: dict(v) for k, v in hashtags.items()},
+		mentions={k: dict(v) for k, v in mentions.items()},
+		offset=end,
+	)
+	summary["fingerprint"] = _fingerprint(path, end)
+	return summary
+
+
+def _read(summary_path):
+	try:
+		with open(summary_path) as f:
+			summary = json.load(f)
+	except (FileNotFoundError, ValueError):
+		return None
+	return summary if summary.get("version") == SUMMARY_VERSION else None
+
+
+def _write(summary, summary_path):
+	os.makedirs(os.path.dirname(summary_path), exist_ok=True)
+	tmp = summary_path + ".tmp"
+	with open(tmp, "w") as f:
+		json.dump(summary, f)
+	os.replace(tmp, summary_path)
+
+
+def update_summary(csv_path=TRAIN_CSV, summary_path=SUMMARY_PATH):
+	"""Bring the persisted summary up to date with ``csv_path`` and return it."""
+	size = os.path.getsize(csv_path)
+	summary = _read(summary_path)
+	if summary is None or summary["offset"] > size or \
+			summary["fingerprint"] != _fingerprint(csv_path, summary["offset"]):
+		summary = _empty_summary()
+	end = _complete_end(csv_path, size)
+	if end > summary["offset"]:
+		with timer("eda_aggregate"):
+			_accumulate(summary, csv_path, summary["offset"], end)
+		_write(summary, summary_path)
+	return summary
+
+
+def get_summary(csv_path=TRAIN_CSV, summary_path=SUMMARY_PATH):
+	"""Return the summary, re-checking the CSV only when its size or mtime changed."""
+	st = os.stat(csv_path)
+	signature = (st.st_size, st.st_mtime_ns)
+	with _lock:
+		cached = _loaded.get(csv_path)
+		if cached is None or cached[0] != signature:
+			cached = _loaded[csv_path] = (signature, update_summary(csv_path, summary_path))
+		return cached[1]
+
+
+def top(counts, k=10):
+	"""Return the ``k`` most common ``(item, count)`` pairs of a summary counter."""
+	return collections.Counter(counts).most_common(k)
+
+
+def merged(per_class):
+	"""Sum a ``{sentiment: {item: count}}`` summary over every sentiment."""
+	total = collections.Counter()
+	for counts in per_class.values():
+		total.update(counts)
+	return total
+
+
+if __name__ == "__main__":
+	summary = update_summary()
+	print("Summarised {:,} tweets into {}".format(summary["rows"], SUMMARY_PATH))
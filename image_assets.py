@@ -0,0 +1,155 @@
+"""
+
+    Resized, recompressed variants of the images under resources/imgs.
+
+    Description: ``st.image("resources/imgs/edna.png", width=200)`` sends the
+	full 760 KB PNG through Streamlit, which decodes, scales and re-encodes
+	it on every rerun. Instead, :func:`image_url` renders each image once at
+	the size it is displayed (``DENSITY`` times the CSS width, for high-DPI
+	screens, or at most ``MAX_WIDTH`` for full-size figures) and caches the
+	result on disk under a name containing the source file's hash, so a
+	changed source gets a new variant and browsers can cache old ones
+	forever. Variants are only made when a page first shows the image.
+
+	With ``server.enableStaticServing`` on (see ``.streamlit/config.toml``)
+	variants are WebP files in the app's ``static/imgs`` folder, served by
+	URL as-is: lossless for charts and logos with few colours, lossy for
+	photos. Otherwise they are an optimised PNG (or JPEG for opaque photos)
+	at exactly the displayed width, which Streamlit passes through without
+	re-encoding.
+
+    Usage:
+
+	python image_assets.py                        # pre-render every image at full size
+	python image_assets.py --width 200 --prune    # ... and at 200 px, dropping stale variants
+
+"""
+import argparse
+import glob
+import os
+import threading
+
+from PIL import Image
+
+from metrics import timer
+from model_registry import RESOURCES_DIR, file_checksum
+
+IMAGES_DIR = os.path.join(RESOURCES_DIR, "imgs")
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "imgs")
+STATIC_URL = "/app/static/imgs/"
+FALLBACK_DIR = os.path.join(RESOURCES_DIR, ".cache", "imgs")
+
+DENSITY = 2
+MAX_WIDTH = 1400
+LOSSLESS_MAX_COLORS = 4096
+WEBP_QUALITY = 80
+
+_variants = {}
+_lock = threading.Lock()
+
+
+def _target_size(image, width, density):
+	"""Pixel size of the variant shown ``width`` CSS pixels wide (``None`` = full size)."""
+	target = min(image.width, width * density if width else MAX_WIDTH)
+	return target, max(1, round(image.height * target / image.width))
+
+
+def _format(image, webp, graphic):
+	"""File extension of the variant: WebP, JPEG for opaque photos, otherwise PNG."""
+	if webp:
+		return "webp"
+	opaque = image.mode in ("RGB", "L") or image.convert("RGBA").getextrema()[3][0] == 255
+	return "jpg" if opaque and not graphic else "png"
+
+
+def _encode(image, f, fmt, graphic):
+	if fmt == "webp" and graphic:
+		image.save(f, "WEBP", lossless=True, method=4)
+	elif fmt == "webp":
+		image.save(f, "WEBP", quality=WEBP_QUALITY, method=4)
+	elif fmt == "jpg":
+		image.convert("RGB").save(f, "JPEG", quality=85, optimize=True, progressive=True)
+	else:
+		if graphic:
+			image = image.quantize(256, method=Image.Quantize.FASTOCTREE)
+		image.save(f, "PNG", optimize=True)
+
+
+def render_variant(source, width=None, webp=True):
+	"""Create (if missing) the variant of ``source`` for ``width`` and return its path."""
+	digest = file_checksum(source)[:16]
+	stem = os.path.splitext(os.path.basename(source))[0]
+	name = "{}-{}-{}".format(stem, digest, "w{}".format(width) if width else "full")
+	base = os.path.join(STATIC_DIR if webp else FALLBACK_DIR, name)
+	for fmt in (["webp"] if webp else ["png", "jpg"]):
+		if os.path.exists(base + "." + fmt):
+			return base + "." + fmt
+
+	with timer("image_variant"), Image.open(source) as image:
+		image.load()
+		# Charts and logos have few colours; resampling adds more, so decide on the source
+		graphic = image.getcolors(LOSSLESS_MAX_COLORS) is not None
+		fmt = _format(image, webp, graphic)
+		# Without static serving Streamlit rescales anything wider than the displayed width
+		target = _target_size(image, width, DENSITY if webp else 1)
+		if target != image.size:
+			image = image.resize(target, Image.LANCZOS)
+		path = base + "." + fmt
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		tmp = path + ".tmp"
+		with open(tmp, "wb") as f:
+			_encode(image, f, fmt, graphic)
+		os.replace(tmp, path)
+	return path
+
+
+def image_url(source, width=None, static_serving=True):
+	"""Return what to pass to ``st.image`` for ``source`` shown ``width`` pixels wide.
+
+	The variant is rendered on the first call and then only re-checked when
+	the source file's size or mtime changes. Falls back to ``source`` itself
+	if it cannot be converted.
+	"""
+	stat = os.stat(source)
+	key = (source, width, static_serving)
+	signature = (stat.st_size, stat.st_mtime_ns)
+	with _lock:
+		cached = _variants.get(key)
+		if cached is not None and cached[0] == signature and os.path.exists(cached[2]):
+			return cached[1]
+		try:
+			path = render_variant(source, width, webp=static_serving)
+		except OSError:
+			return source
+		url = STATIC_URL + os.path.basename(path) if static_serving else path
+		_variants[key] = (signature, url, path)
+		return url
+
+
+def build_all(widths=(), prune=False):
+	"""Render the full-size variant and one per ``widths`` of every image; return their paths."""
+	paths = []
+	for source in sorted(glob.glob(os.path.join(IMAGES_DIR, "*.png"))):
+		for width in [None] + list(widths):
+			paths.append(render_variant(source, width))
+	if prune:
+		for path in glob.glob(os.path.join(STATIC_DIR, "*.webp")):
+			if path not in paths:
+				os.remove(path)
+	return paths
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Pre-render web-sized variants of resources/imgs.")
+	parser.add_argument("--width", type=int, action="append", default=[], help="also render for this display width")
+	parser.add_argument("--prune", action="store_true", help="delete variants not produced by this run")
+	args = parser.parse_args(argv)
+	paths = build_all(args.width, args.prune)
+	before = sum(os.path.getsize(p) for p in glob.glob(os.path.join(IMAGES_DIR, "*.png")))
+	after = sum(os.path.getsize(p) for p in paths)
+	print("{} variants in {} ({:,} KB of sources, {:,} KB of variants)".format(
+		len(paths), STATIC_DIR, before // 1024, after // 1024))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,169 @@
+"""
+
+    Sparse inference for the linear tweet classifiers.
+
+    Description: ``tweet_cv.transform`` returns a CSR matrix with a few dozen
+	non-zeros per tweet. Calling ``.toarray()`` on it before ``predict``
+	allocates a dense row as wide as the whole vocabulary (~128k floats per
+	tweet). All three models are linear, so the decision function is just
+	``X @ coef_.T + intercept_``, which can be computed straight from the CSR
+	matrix. The labels returned are the same as ``model.predict`` on the
+	dense input.
+
+"""
+import weakref
+
+import numpy as np
+import scipy.sparse as sp
+
+from metrics import timer
+
+# Human readable names for the sentiment classes
+LABELS = {-1: "Anti", 0: "Neutral", 1: "Pro", 2: "News"}
+
+# Rows per chunk when vectorizing large batches of raw text
+DEFAULT_BATCH_SIZE = 4096
+
+# Transposed coefficient matrices, computed once per model object
+_coef_t = weakref.WeakKeyDictionary()
+
+
+def _coefficients(model):
+	"""Return ``(coef_.T, intercept_)`` for ``model``, caching the transpose."""
+	try:
+		coef_t = _coef_t[model]
+	except (KeyError, TypeError):
+		coef_t = np.ascontiguousarray(np.asarray(model.coef_).T)
+		try:
+			_coef_t[model] = coef_t
+		except TypeError:
+			pass
+	return coef_t, np.asarray(model.intercept_)
+
+
+def decision_scores(model, X):
+	"""Return the decision scores of a linear ``model`` for the sparse matrix ``X``."""
+	if not sp.issparse(X):
+		X = sp.csr_matrix(X)
+	coef_t, intercept = _coefficients(model)
+	# Sparse @ dense yields a dense (n_samples, n_classes) array
+	scores = np.asarray(X.tocsr() @ coef_t)
+	scores += intercept
+	return scores
+
+
+def labels_from_scores(classes, scores):
+	"""Map decision scores to class labels the way sklearn's linear models do."""
+	classes = np.asarray(classes)
+	if scores.ndim == 1 or scores.shape[1] == 1:
+		return classes[(scores.ravel() > 0).astype(int)]
+	return classes[scores.argmax(axis=1)]
+
+
+def predict(model, X, model_name=None):
+	"""Predict class labels for the sparse feature matrix ``X``.
+
+	``model_name`` (the registry name) keys the ``predict`` timings so they
+	line up with the other stages of the same request.
+	"""
+	with timer("predict", model_name or type(model).__name__):
+		return labels_from_scores(model.classes_, decision_scores(model, X))
+
+
+def predict_texts(model, vectorizer, texts, batch_size=DEFAULT_BATCH_SIZE, model_name=None):
+	"""Vectorize and classify ``texts`` in chunks, keeping every step sparse."""
+	texts = list(texts)
+	if not texts:
+		return np.asarray(model.classes_)[:0]
+	labels = []
+	for start in range(0, len(texts), batch_size):
+		with timer("vectorize"):
+			X = vectorizer.transform(texts[start:start + batch_size])
+		labels.append(predict(model, X, model_name))
+	return np.concatenate(labels)
+
+
+class StackedModels:
+	"""Several linear models over the same features, scored with one matrix multiply.
+
+	The coefficient matrices are concatenated column-wise so a single
+	``X @ W`` yields every model's decision scores side by side.
+	"""
+
+	def __init__(self, models):
+		self.names = list(models)
+		self.models = [models[name] for name in self.names]
+		self.classes_ = np.asarray(self.models[0].classes_)
+		for name, model in zip(self.names, self.models):
+			if not np.array_equal(model.classes_, self.classes_):
+				raise ValueError("Model '{}' has different classes and cannot be stacked".format(name))
+		self.width = len(np.asarray(self.models[0].intercept_))
+		self.coef_t = np.ascontiguousarray(np.hstack([np.asarray(m.coef_).T for m in self.models]))
+		self.intercept = np.concatenate([np.asarray(m.intercept_) for m in self.models])
+
+	def decision_scores(self, X):
+		"""Return ``{model name: (n_samples, n_scores) array}`` for the sparse ``X``."""
+		if not sp.issparse(X):
+			X = sp.csr_matrix(X)
+		scores = np.asarray(X.tocsr() @ self.coef_t)
+		scores += self.intercept
+		return {name: scores[:, i * self.width:(i + 1) * self.width]
+			for i, name in enumerate(self.names)}
+
+	def predict(self, X, ensemble=False, model_name="stacked"):
+		"""Score ``X`` with every model.
+
+		Returns ``(labels, scores)`` dictionaries keyed by model name. With
+		``ensemble`` the labels also contain a :data:`ENSEMBLE` entry holding
+		the majority vote. ``model_name`` keys the ``predict`` timings.
+		"""
+		with timer("predict", model_name):
+			scores = self.decision_scores(X)
+			labels = {name: labels_from_scores(self.classes_, s) for name, s in scores.items()}
+			if ensemble:
+				labels[ENSEMBLE] = majority_vote([labels[name] for name in self.names])
+		return labels, scores
+
+
+# Key of the majority-vote label returned by StackedModels.predict
+ENSEMBLE = "Ensemble (majority vote)"
+
+# Stacks built from the current model objects, rebuilt when any is replaced
+_stacks = {}
+
+
+def stack(models):
+	"""Return a :class:`StackedModels` for the ``{name: model}`` mapping, reusing a cached one."""
+	key = tuple(models)
+	cached = _stacks.get(key)
+	if cached is None or any(a is not b for a, b in zip(cached.models, models.values())):
+		cached = _stacks[key] = StackedModels(models)
+	return cached
+
+
+def majority_vote(label_arrays):
+	"""Most common label per row; rows where no two models agree keep the first model's label."""
+	votes = np.vstack(label_arrays)
+	if votes.shape[1] == 0:
+		return votes[0]
+	candidates = np.unique(votes)
+	counts = np.stack([(votes == c).sum(axis=0) for c in candidates])
+	return np.where(counts.max(axis=0) > 1, candidates[counts.argmax(axis=0)], votes[0])
+
+
+def compare_texts(models, vectorizer, texts, ensemble=True, batch_size=DEFAULT_BATCH_SIZE, model_name="stacked"):
+	"""Vectorize ``texts`` once and score them with every model in ``models``.
+
+	Returns ``(labels, scores)`` as described in :meth:`StackedModels.predict`,
+	concatenated over all chunks.
+	"""
+	stacked = stack(models)
+	texts = list(texts)
+	parts = []
+	for start in range(0, max(len(texts), 1), batch_size):
+		with timer("vectorize"):
+			X = vectorizer.transform(texts[start:start + batch_size])
+		parts.append(stacked.predict(X, ensemble, model_name))
+	labels = {name: np.concatenate([p[0][name] for p in parts]) for name in parts[0][0]}
+	scores = {name: np.vstack([p[1][name] for p in parts]) for name in parts[0][1]}
+	return labels, scores
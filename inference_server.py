@@ -0,0 +1,284 @@
+"""
+
+    Headless HTTP prediction service with dynamic micro-batching.
+
+    Description: Serves the same vectorizer and classifiers as the Streamlit
+	app without going through the UI. Incoming requests are put on a bounded
+	queue; a single batching task drains it, waiting at most ``--window-ms``
+	for up to ``--max-batch`` tweets, vectorizes the whole batch in one call
+	and scores it per requested model. When the queue is full new requests
+	are rejected with ``503`` so clients can back off.
+
+	Only the standard library is used for the HTTP layer.
+
+    Endpoints:
+
+	POST /predict   {"text": "...", "model": "sgd"}  or  {"texts": [...], "model": "lsvc"}
+	GET  /health    liveness, queue depth and loaded models
+	GET  /metrics   stage latencies and counters in the Prometheus text format
+
+    Usage:
+
+	python inference_server.py --port 8000 --window-ms 5 --max-batch 256
+
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import inference
+from metrics import metrics, request, timer
+from model_registry import registry, resolve_model_name, MODEL_NAMES, VECTORIZER
+
+DEFAULT_WINDOW_MS = 5.0
+DEFAULT_MAX_BATCH = 256
+DEFAULT_QUEUE_SIZE = 10000
+MAX_BODY_BYTES = 1 << 20
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+	413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class QueueFull(Exception):
+	"""Raised when the batcher cannot accept more work."""
+
+
+class MicroBatcher:
+	"""Coalesces concurrent prediction requests into batched model calls."""
+
+	def __init__(self, window_ms=DEFAULT_WINDOW_MS, max_batch=DEFAULT_MAX_BATCH, queue_size=DEFAULT_QUEUE_SIZE):
+		self.window = window_ms / 1000.0
+		self.max_batch = max_batch
+		self.queue = asyncio.Queue(maxsize=queue_size)
+		self.batches = 0
+		self.items = 0
+		self._task = None
+
+	def start(self):
+		self._task = asyncio.ensure_future(self._run())
+
+	async def stop(self):
+		if self._task:
+			self._task.cancel()
+			try:
+				await self._task
+			except asyncio.CancelledError:
+				pass
+
+	async def submit(self, model_name, texts):
+		"""Queue ``texts`` for ``model_name`` and wait for their labels."""
+		future = asyncio.get_running_loop().create_future()
+		try:
+			self.queue.put_nowait((model_name, texts, future))
+		except asyncio.QueueFull:
+			raise QueueFull()
+		return await future
+
+	async def _collect(self):
+		"""Wait for one request, then gather more until the window or batch size runs out."""
+		batch = [await self.queue.get()]
+		size = len(batch[0][1])
+		deadline = time.monotonic() + self.window
+		while size < self.max_batch:
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				break
+			try:
+				item = await asyncio.wait_for(self.queue.get(), remaining)
+			except asyncio.TimeoutError:
+				break
+			batch.append(item)
+			size += len(item[1])
+		return batch
+
+	async def _run(self):
+		loop = asyncio.get_running_loop()
+		while True:
+			batch = await self._collect()
+			try:
+				results = await loop.run_in_executor(None, score_batch, [(m, t) for m, t, _ in batch])
+			except Exception as e:
+				for _, _, future in batch:
+					if not future.done():
+						future.set_exception(e)
+				continue
+			self.batches += 1
+			self.items += sum(len(t) for _, t, _ in batch)
+			for (_, _, future), labels in zip(batch, results):
+				if not future.done():
+					future.set_result(labels)
+
+
+def score_batch(requests):
+	"""Vectorize every text in ``requests`` at once and score each group with its model.
+
+	``requests`` is a list of ``(model_name, texts)``; returns a list of label
+	lists in the same order.
+	"""
+	texts = [text for _, group in requests for text in group]
+	with request("http_batch", input_size=len(texts)):
+		return _score_batch(requests, texts)
+
+
+def _score_batch(requests, texts):
+	with timer("vectorize"):
+		X = registry.get(VECTORIZER).transform(texts)
+	rows_by_model = {}
+	offset = 0
+	for i, (model_name, group) in enumerate(requests):
+		rows_by_model.setdefault(model_name, []).append((i, offset, offset + len(group)))
+		offset += len(group)
+	results = [None] * len(requests)
+	for model_name, spans in rows_by_model.items():
+		rows = [r for _, start, stop in spans for r in range(start, stop)]
+		labels = inference.predict(registry.get(model_name), X[rows], model_name).tolist()
+		position = 0
+		for i, start, stop in spans:
+			results[i] = labels[position:position + stop - start]
+			position += stop - start
+	return results
+
+
+class PredictionServer:
+	"""Minimal HTTP/1.1 front end for a :class:`MicroBatcher`."""
+
+	def __init__(self, batcher, default_model="LinearSVC"):
+		self.batcher = batcher
+		self.default_model = default_model
+		self.started = time.time()
+
+	async def handle(self, reader, writer):
+		try:
+			while True:
+				request = await self._read_request(reader)
+				if request is None:
+					break
+				method, path, headers, body = request
+				status, payload = await self._route(method, path, body)
+				keep_alive = headers.get("connection", "").lower() != "close"
+				self._respond(writer, status, payload, keep_alive)
+				await writer.drain()
+				if not keep_alive:
+					break
+		except ValueError:
+			# Malformed request line or Content-Length: answer, then drop the connection
+			try:
+				self._respond(writer, 400, {"error": "malformed HTTP request"}, False)
+				await writer.drain()
+			except ConnectionError:
+				pass
+		except (ConnectionError, asyncio.IncompleteReadError):
+			pass
+		finally:
+			writer.close()
+
+	async def _read_request(self, reader):
+		line = await reader.readline()
+		if not line:
+			return None
+		method, path, _ = line.decode("latin-1").split(" ", 2)
+		headers = {}
+		while True:
+			line = await reader.readline()
+			if line in (b"\r\n", b"\n", b""):
+				break
+			key, _, value = line.decode("latin-1").partition(":")
+			headers[key.strip().lower()] = value.strip()
+		length = int(headers.get("content-length", 0))
+		if length < 0:
+			raise ValueError("negative Content-Length")
+		if length > MAX_BODY_BYTES:
+			return method, path, {"connection": "close"}, None
+		body = await reader.readexactly(length) if length else b""
+		return method, path.split("?", 1)[0], headers, body
+
+	def _respond(self, writer, status, payload, keep_alive):
+		if isinstance(payload, str):
+			body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+		else:
+			body, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+		head = "HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\n".format(
+			status, _REASONS.get(status, ""), content_type, len(body))
+		if status == 503:
+			head += "Retry-After: 1\r\n"
+		head += "Connection: {}\r\n\r\n".format("keep-alive" if keep_alive else "close")
+		writer.write(head.encode("latin-1") + body)
+
+	async def _route(self, method, path, body):
+		if path == "/health":
+			return 200, {
+				"status": "ok",
+				"uptime_s": round(time.time() - self.started, 1),
+				"queue_depth": self.batcher.queue.qsize(),
+				"batches": self.batcher.batches,
+				"items": self.batcher.items,
+				"models": [m["name"] for m in registry.list_models() if m["loaded"]],
+			}
+		if path == "/metrics":
+			return 200, metrics.render_prometheus()
+		if path != "/predict":
+			return 404, {"error": "not found"}
+		if method != "POST":
+			return 405, {"error": "use POST"}
+		if body is None:
+			return 413, {"error": "request body too large"}
+		try:
+			request = json.loads(body or b"{}")
+			if not isinstance(request, dict):
+				raise ValueError()
+			texts = request["texts"] if "texts" in request else [request["text"]]
+			if not isinstance(texts, list) or not texts or not all(isinstance(t, str) for t in texts):
+				raise ValueError()
+		except (ValueError, KeyError, TypeError):
+			return 400, {"error": "expected a JSON object with a 'text' string or a non-empty 'texts' list of strings"}
+		model = request.get("model") or self.default_model
+		if not isinstance(model, str):
+			return 400, {"error": "'model' must be a string"}
+		model_name = resolve_model_name(model)
+		if model_name not in MODEL_NAMES:
+			return 400, {"error": "unknown model '{}'".format(request.get("model"))}
+		try:
+			sentiments = await self.batcher.submit(model_name, texts)
+		except QueueFull:
+			metrics.increment("http_rejected")
+			return 503, {"error": "server busy, retry later"}
+		return 200, {
+			"model": model_name,
+			"predictions": [{"sentiment": s, "label": inference.LABELS.get(s, str(s))} for s in sentiments],
+		}
+
+
+async def serve(host, port, window_ms, max_batch, queue_size, default_model):
+	registry.warm_up()
+	batcher = MicroBatcher(window_ms, max_batch, queue_size)
+	batcher.start()
+	app = PredictionServer(batcher, resolve_model_name(default_model))
+	server = await asyncio.start_server(app.handle, host, port)
+	print("Serving predictions on http://{}:{}".format(host, port))
+	try:
+		async with server:
+			await server.serve_forever()
+	finally:
+		await batcher.stop()
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Serve the tweet classifiers over HTTP.")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8000)
+	parser.add_argument("--window-ms", type=float, default=DEFAULT_WINDOW_MS,
+		help="how long to wait for more requests before scoring a batch")
+	parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH, help="maximum tweets per batch")
+	parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+		help="pending requests accepted before returning 503")
+	parser.add_argument("--model", default="lsvc", help="model used when a request does not name one")
+	args = parser.parse_args(argv)
+	try:
+		asyncio.run(serve(args.host, args.port, args.window_ms, args.max_batch, args.queue_size, args.model))
+	except KeyboardInterrupt:
+		pass
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,100 @@
+"""
+
+    Local load generator for ``inference_server.py``.
+
+    Description: Opens ``--concurrency`` keep-alive connections to the
+	prediction service and sends ``--requests`` single-tweet predictions in
+	total, then reports throughput, latency percentiles and how many
+	requests were rejected with ``503``.
+
+    Usage:
+
+	python inference_server.py &
+	python load_test.py --requests 5000 --concurrency 64 --model sgd
+
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+# A few realistic tweets to cycle through
+SAMPLE_TWEETS = [
+	"CHECK OUT THESE WEATHER STORIES https://t.co/LwVzcPO30e Do Not believe the Global warming climate change stories sold by UN, Vatican &amp; Obama",
+	"RT @StephenSchlegel: she's thinking about how she's going to die because your husband doesn't believe in climate change https://t.co/SjoFoNggCk",
+	"Climate change is the biggest threat to humanity, we need to act now #ClimateAction",
+	"EPA chief doesn't think carbon dioxide is main cause of global warming https://t.co/yeLvcEFXkC via @CNN",
+	"Global warming is a hoax invented to raise taxes",
+	"Watch #BeforeTheFlood right here, as @LeoDiCaprio travels the world to tackle climate change",
+]
+
+
+async def _post(reader, writer, host, body):
+	request = (
+		"POST /predict HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\n"
+		"Content-Length: {}\r\n\r\n".format(host, len(body))
+	).encode("latin-1") + body
+	writer.write(request)
+	await writer.drain()
+	status = int((await reader.readline()).split()[1])
+	length = 0
+	while True:
+		line = await reader.readline()
+		if line in (b"\r\n", b""):
+			break
+		key, _, value = line.decode("latin-1").partition(":")
+		if key.lower() == "content-length":
+			length = int(value)
+	await reader.readexactly(length)
+	return status
+
+
+async def _client(host, port, model, count, latencies, statuses):
+	reader, writer = await asyncio.open_connection(host, port)
+	try:
+		for _ in range(count):
+			body = json.dumps({"text": random.choice(SAMPLE_TWEETS), "model": model}).encode("utf-8")
+			started = time.perf_counter()
+			status = await _post(reader, writer, host, body)
+			latencies.append(time.perf_counter() - started)
+			statuses[status] = statuses.get(status, 0) + 1
+	finally:
+		writer.close()
+
+
+def _percentile(values, q):
+	values = sorted(values)
+	return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+async def run(host, port, model, total, concurrency):
+	"""Send ``total`` requests over ``concurrency`` connections and return a summary."""
+	latencies, statuses = [], {}
+	per_client = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+	started = time.perf_counter()
+	await asyncio.gather(*(_client(host, port, model, n, latencies, statuses) for n in per_client if n))
+	elapsed = time.perf_counter() - started
+	return {
+		"requests": len(latencies),
+		"elapsed_s": round(elapsed, 3),
+		"throughput_rps": round(len(latencies) / elapsed, 1),
+		"latency_ms": {q: round(_percentile(latencies, int(q[1:])) * 1000, 2) for q in ("p50", "p95", "p99")},
+		"status_codes": statuses,
+	}
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Measure throughput and latency of inference_server.py.")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8000)
+	parser.add_argument("--model", default="lsvc")
+	parser.add_argument("--requests", type=int, default=2000)
+	parser.add_argument("--concurrency", type=int, default=32)
+	args = parser.parse_args(argv)
+	summary = asyncio.run(run(args.host, args.port, args.model, args.requests, args.concurrency))
+	print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,241 @@
+"""
+
+    Lightweight latency histograms and counters for the hot paths.
+
+    Description: Code wraps each stage in ``with metrics.timer("stage", model):``
+	and each user-facing action in ``with metrics.request("name", ...):``.
+	Timings go into fixed-bucket histograms keyed by stage and model, which
+	can be shown on the app's hidden ops page (``?ops=1``), rendered in the
+	Prometheus text format, served by ``inference_server.py`` at
+	``/metrics`` or written periodically to ``METRICS_FILE``.
+
+	Requests slower than ``SLOW_REQUEST_MS`` are sampled (``SLOW_REQUEST_SAMPLE``
+	is the fraction kept) and logged with their input size and per-stage
+	breakdown.
+
+	Set ``APP_METRICS=0`` to disable everything; timers then return a shared
+	no-op context manager.
+
+"""
+import bisect
+import collections
+import contextlib
+import logging
+import os
+import random
+import threading
+import time
+
+ENABLED = os.environ.get("APP_METRICS", "1") != "0"
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 500))
+SLOW_REQUEST_SAMPLE = float(os.environ.get("SLOW_REQUEST_SAMPLE", 1.0))
+METRICS_FILE = os.environ.get("METRICS_FILE")
+METRICS_FILE_INTERVAL = 10.0
+
+# Upper bounds of the latency buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+logger = logging.getLogger("metrics")
+
+_NULL = contextlib.nullcontext()
+
+
+class _Histogram:
+	def __init__(self):
+		self.counts = [0] * len(BUCKETS)
+		self.total = 0.0
+		self.count = 0
+		self.max = 0.0
+
+	def observe(self, seconds):
+		self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+		self.total += seconds
+		self.count += 1
+		if seconds > self.max:
+			self.max = seconds
+
+	def quantile(self, q):
+		"""Estimate the ``q`` quantile by interpolating within the histogram buckets."""
+		if not self.count:
+			return 0.0
+		rank = q * self.count
+		seen = 0
+		for i, n in enumerate(self.counts):
+			if seen + n >= rank and n:
+				lower = BUCKETS[i - 1] if i else 0.0
+				upper = min(BUCKETS[i], self.max)
+				return lower + (upper - lower) * (rank - seen) / n
+			seen += n
+		return self.max
+
+
+class MetricsRegistry:
+	"""Histograms, counters and slow-request samples for one process."""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._histograms = collections.defaultdict(_Histogram)
+		self._counters = collections.Counter()
+		self._collectors = []
+		self.slow_requests = collections.deque(maxlen=50)
+		self._written_at = 0.0
+
+	def observe(self, stage, seconds, model=None):
+		with self._lock:
+			self._histograms[(stage, model or "")].observe(seconds)
+
+	def increment(self, name, amount=1, model=None):
+		with self._lock:
+			self._counters[(name, model or "")] += amount
+
+	def add_collector(self, collect):
+		"""Register ``collect()``, returning ``{name: value}`` gauges sampled at export time."""
+		self._collectors.append(collect)
+
+	def reset(self):
+		with self._lock:
+			self._histograms.clear()
+			self._counters.clear()
+			self.slow_requests.clear()
+
+	def summary(self):
+		"""Per-stage statistics in milliseconds, for display."""
+		with self._lock:
+			items = sorted(self._histograms.items())
+			rows = []
+			for (stage, model), h in items:
+				rows.append({
+					"stage": stage,
+					"model": model,
+					"count": h.count,
+					"mean_ms": 1000 * h.total / h.count if h.count else 0.0,
+					"p50_ms": 1000 * h.quantile(0.5),
+					"p95_ms": 1000 * h.quantile(0.95),
+					"p99_ms": 1000 * h.quantile(0.99),
+					"max_ms": 1000 * h.max,
+				})
+			return rows
+
+	def counters(self):
+		with self._lock:
+			return {(name + ("[" + model + "]" if model else "")): value
+				for (name, model), value in sorted(self._counters.items())}
+
+	def gauges(self):
+		values = {}
+		for collect in self._collectors:
+			try:
+				values.update(collect())
+			except Exception:
+				logger.exception("Metrics collector failed")
+		return values
+
+	def render_prometheus(self):
+		"""Return all metrics in the Prometheus text exposition format."""
+		lines = ["# HELP app_stage_seconds Latency of each processing stage.",
+			"# TYPE app_stage_seconds histogram"]
+		with self._lock:
+			for (stage, model), h in sorted(self._histograms.items()):
+				labels = 'stage="{}",model="{}"'.format(_escape(stage), _escape(model))
+				cumulative = 0
+				for bound, n in zip(BUCKETS, h.counts):
+					cumulative += n
+					le = "+Inf" if bound == float("inf") else repr(bound)
+					lines.append('app_stage_seconds_bucket{{{},le="{}"}} {}'.format(labels, le, cumulative))
+				lines.append("app_stage_seconds_sum{{{}}} {}".format(labels, h.total))
+				lines.append("app_stage_seconds_count{{{}}} {}".format(labels, h.count))
+			lines.append("# TYPE app_events_total counter")
+			for (name, model), value in sorted(self._counters.items()):
+				lines.append('app_events_total{{event="{}",model="{}"}} {}'.format(_escape(name), _escape(model), value))
+		gauges = self.gauges()
+		if gauges:
+			lines.append("# TYPE app_gauge gauge")
+			for name, value in sorted(gauges.items()):
+				lines.append('app_gauge{{name="{}"}} {}'.format(_escape(name), value))
+		return "\n".join(lines) + "\n"
+
+	def write_textfile(self, path=None, force=False):
+		"""Write the Prometheus text to ``path`` (default ``METRICS_FILE``), at most every few seconds."""
+		path = path or METRICS_FILE
+		now = time.monotonic()
+		if not path or (not force and now - self._written_at < METRICS_FILE_INTERVAL):
+			return
+		self._written_at = now
+		tmp = path + ".tmp"
+		with open(tmp, "w") as f:
+			f.write(self.render_prometheus())
+		os.replace(tmp, path)
+
+
+def _escape(value):
+	return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = MetricsRegistry()
+_local = threading.local()
+
+
+class _Timer:
+	__slots__ = ("stage", "model", "started")
+
+	def __init__(self, stage, model):
+		self.stage = stage
+		self.model = model
+
+	def __enter__(self):
+		self.started = time.perf_counter()
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		elapsed = time.perf_counter() - self.started
+		metrics.observe(self.stage, elapsed, self.model)
+		trace = getattr(_local, "trace", None)
+		if trace is not None:
+			trace.append((self.stage, elapsed))
+
+
+def timer(stage, model=None):
+	"""Context manager recording the duration of ``stage`` (optionally per ``model``)."""
+	if not ENABLED:
+		return _NULL
+	return _Timer(stage, model)
+
+
+class _Request:
+	def __init__(self, name, model, input_size):
+		self.name = name
+		self.model = model
+		self.input_size = input_size
+
+	def __enter__(self):
+		self.outer = getattr(_local, "trace", None)
+		_local.trace = []
+		self.started = time.perf_counter()
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		elapsed = time.perf_counter() - self.started
+		stages, _local.trace = _local.trace, self.outer
+		if self.outer is not None:
+			self.outer.extend(stages)
+		metrics.observe(self.name, elapsed, self.model)
+		metrics.increment(self.name + "_errors" if exc_type else self.name, model=self.model)
+		if elapsed * 1000 >= SLOW_REQUEST_MS and random.random() < SLOW_REQUEST_SAMPLE:
+			sample = {
+				"time": time.strftime("%Y-%m-%d %H:%M:%S"),
+				"request": self.name,
+				"model": self.model,
+				"input_size": self.input_size,
+				"total_ms": round(elapsed * 1000, 2),
+				"stages_ms": [(stage, round(seconds * 1000, 2)) for stage, seconds in stages],
+			}
+			metrics.slow_requests.append(sample)
+			logger.warning("Slow request: %s", sample)
+		metrics.write_textfile()
+
+
+def request(name, model=None, input_size=None):
+	"""Context manager timing a whole user-facing action and collecting its stage breakdown."""
+	if not ENABLED:
+		return _NULL
+	return _Request(name, model, input_size)
@@ -0,0 +1,196 @@
+"""
+
+    Process-wide registry for the pickled vectorizer and classifiers.
+
+    Description: Streamlit re-executes ``base_app.py`` on every interaction,
+	but imported modules stay alive for the lifetime of the server process.
+	Keeping the loaded artifacts here means each ``.pkl`` file is unpickled
+	once per process and shared by every session and rerun, instead of once
+	per "Classify" click.
+
+	Artifacts are reloaded automatically when the file on disk changes. The
+	file's size and mtime are polled at most every ``check_interval`` seconds
+	and the (more expensive) checksum is only recomputed when those change.
+	If a changed file cannot be read (e.g. it is caught half-written or was
+	removed) the previously loaded object keeps being served and the file
+	is tried again after another ``check_interval``.
+
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import joblib
+
+from metrics import metrics, timer
+
+logger = logging.getLogger("model_registry")
+
+RESOURCES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources")
+
+# Registry name -> file name within RESOURCES_DIR. The classifier names match
+# the options offered on the Predict page.
+VECTORIZER = "vectorizer"
+DEFAULT_ARTIFACTS = {
+	VECTORIZER: "vect.pkl",
+	"LinearSVC": "final_lsvc.pkl",
+	"Logistic Regression": "final_logistic.pkl",
+	"Stochastic Gradient Descent (SGD)": "final_SGD.pkl",
+}
+MODEL_NAMES = [name for name in DEFAULT_ARTIFACTS if name != VECTORIZER]
+
+# Short names accepted by the command-line tools and the HTTP service
+MODEL_ALIASES = {
+	"lsvc": "LinearSVC",
+	"logistic": "Logistic Regression",
+	"sgd": "Stochastic Gradient Descent (SGD)",
+}
+
+
+def resolve_model_name(name):
+	"""Map a short alias such as ``sgd`` to its registry name."""
+	return MODEL_ALIASES.get(name.lower(), name) if name else name
+
+
+def file_checksum(path, chunk_size=1 << 20):
+	"""Return the sha256 hex digest of the file at ``path``."""
+	digest = hashlib.sha256()
+	with open(path, "rb") as f:
+		for chunk in iter(lambda: f.read(chunk_size), b""):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+
+class _Entry:
+	"""Bookkeeping for a single registered artifact."""
+
+	def __init__(self, name, path):
+		self.name = name
+		self.path = path
+		self.obj = None
+		self.checksum = None
+		self.stat = None
+		self.loaded_at = None
+		self.checked_at = 0.0
+		self.lock = threading.Lock()
+
+
+class ModelRegistry:
+	"""Loads each registered artifact once and hands out the shared object."""
+
+	def __init__(self, resources_dir=RESOURCES_DIR, artifacts=None, check_interval=2.0):
+		self.resources_dir = resources_dir
+		self.check_interval = check_interval
+		self._entries = {}
+		self._lock = threading.Lock()
+		for name, filename in (artifacts or DEFAULT_ARTIFACTS).items():
+			self.register(name, filename)
+
+	def register(self, name, filename):
+		"""Register (or re-point) ``name`` to a file in the resources directory."""
+		path = os.path.join(self.resources_dir, filename)
+		with self._lock:
+			self._entries[name] = _Entry(name, path)
+
+	def names(self):
+		"""Return the registered artifact names."""
+		return list(self._entries)
+
+	def _entry(self, name):
+		try:
+			return self._entries[name]
+		except KeyError:
+			raise KeyError("Unknown model '{}'. Registered: {}".format(name, ", ".join(self._entries)))
+
+	def _stat(self, path):
+		st = os.stat(path)
+		return (st.st_size, st.st_mtime_ns)
+
+	def _load(self, entry, stat):
+		checksum = file_checksum(entry.path)
+		if entry.obj is not None and checksum == entry.checksum:
+			# Touched but unchanged - keep the object we already have
+			entry.stat = stat
+			return
+		with timer("artifact_load", entry.name), open(entry.path, "rb") as f:
+			obj = joblib.load(f)
+		if entry.obj is not None:
+			metrics.increment("artifact_reload", model=entry.name)
+		entry.obj, entry.checksum, entry.stat = obj, checksum, stat
+		entry.loaded_at = time.time()
+
+	def get(self, name):
+		"""Return the loaded artifact, loading or hot-reloading it if needed."""
+		entry = self._entry(name)
+		now = time.monotonic()
+		if entry.obj is not None and now - entry.checked_at < self.check_interval:
+			return entry.obj
+		with entry.lock:
+			if entry.obj is None or now - entry.checked_at >= self.check_interval:
+				try:
+					stat = self._stat(entry.path)
+					if entry.obj is None or stat != entry.stat:
+						self._load(entry, stat)
+				except Exception:
+					if entry.obj is None:
+						raise
+					logger.exception("Could not reload %s from %s; serving the previous version", name, entry.path)
+					metrics.increment("artifact_reload_failed", model=name)
+				entry.checked_at = now
+			return entry.obj
+
+	def reload(self, name):
+		"""Re-check ``name`` on disk now, reloading it if its contents changed."""
+		entry = self._entry(name)
+		with entry.lock:
+			entry.stat = None
+			entry.checked_at = 0.0
+		return self.get(name)
+
+	def swap(self, name, obj, path=None):
+		"""Atomically replace the object served for ``name``.
+
+		With ``path`` the entry is re-pointed at that file (which must already
+		hold ``obj``), so later hot reloads follow it instead of the original.
+		"""
+		entry = self._entry(name)
+		with entry.lock:
+			if path:
+				entry.path = path
+			entry.checksum = file_checksum(entry.path)
+			entry.stat = self._stat(entry.path)
+			entry.obj = obj
+			entry.loaded_at = time.time()
+			entry.checked_at = time.monotonic()
+		metrics.increment("artifact_swap", model=name)
+
+	def checksum(self, name):
+		"""Return the checksum of the currently loaded version of ``name``."""
+		self.get(name)
+		return self._entry(name).checksum
+
+	def warm_up(self, names=None):
+		"""Load ``names`` (default: everything registered) ahead of first use."""
+		for name in names or self.names():
+			self.get(name)
+
+	def list_models(self):
+		"""Describe every registered artifact and whether it is loaded."""
+		models = []
+		for name, entry in list(self._entries.items()):
+			models.append({
+				"name": name,
+				"path": entry.path,
+				"loaded": entry.obj is not None,
+				"type": type(entry.obj).__name__ if entry.obj is not None else None,
+				"checksum": entry.checksum,
+				"size_bytes": entry.stat[0] if entry.stat else None,
+				"loaded_at": entry.loaded_at,
+			})
+		return models
+
+
+# Shared by everything imported into this process
+registry = ModelRegistry()
@@ -0,0 +1,410 @@
+"""
+
+    Online updates of the SGD classifier from labelled feedback.
+
+    Description: Corrected labels submitted from the Predict page or by batch
+	jobs are queued (and appended to ``feedback.jsonl`` for auditing). A
+	background thread collects them into mini-batches, vectorizes them with
+	``tweet_cv`` and applies ``partial_fit`` to a copy of the live SGD model.
+
+	Before a candidate goes live its accuracy is measured on held-out data
+	that neither ``final_SGD.pkl`` nor any online update was trained on:
+	the labelled file ``ONLINE_HOLDOUT_CSV`` (default
+	``resources/holdout.csv``, with ``message`` and ``sentiment`` columns)
+	if it exists, otherwise the corrections reserved for evaluation - one
+	in ``HOLDOUT_EVERY``, chosen by a hash of the text so duplicates always
+	land on the same side - once ``MIN_HOLDOUT`` of them have arrived. A
+	random sample of ``train.csv`` would not do: the shipped model was fit
+	on it. Until there is a holdout, corrections stay queued rather than
+	being trained on unchecked (``ONLINE_ALLOW_UNGUARDED=1`` promotes
+	without a guard instead). If a candidate regresses by more than
+	``tolerance`` it is rolled back (never served). Otherwise it is written
+	as a numbered snapshot under ``resources/snapshots`` and swapped into
+	the model registry atomically, so predictions keep using the old model
+	until the swap and never block on training. Only the newest
+	``KEEP_SNAPSHOTS`` snapshot files (and the active one) are kept.
+	``manifest.json`` records every update and which snapshot is active;
+	other processes follow it, and it is restored on startup.
+
+	Set ``ONLINE_LEARNING=0`` to hide the feedback form and serve only the
+	shipped model.
+
+    Usage:
+
+	python online_learning.py corrections.csv --label-field sentiment
+
+"""
+import argparse
+import copy
+import csv
+import datetime
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import joblib
+import numpy as np
+
+import inference
+from metrics import metrics, timer
+from model_registry import registry, resolve_model_name, DEFAULT_ARTIFACTS, RESOURCES_DIR, VECTORIZER
+
+SGD_MODEL = resolve_model_name("sgd")
+ENABLED = os.environ.get("ONLINE_LEARNING", "1") != "0"
+SNAPSHOT_DIR = os.path.join(RESOURCES_DIR, "snapshots")
+HOLDOUT_CSV = os.environ.get("ONLINE_HOLDOUT_CSV", os.path.join(RESOURCES_DIR, "holdout.csv"))
+HOLDOUT_EVERY = 5
+MIN_HOLDOUT = 50
+ALLOW_UNGUARDED = os.environ.get("ONLINE_ALLOW_UNGUARDED", "0") == "1"
+KEEP_SNAPSHOTS = 5
+
+logger = logging.getLogger("online_learning")
+
+
+def _read_holdout(path):
+	"""``(texts, labels)`` from a labelled CSV, or ``None`` when there is no such file."""
+	if not path or not os.path.exists(path):
+		return None
+	with open(path, newline="", encoding="utf-8") as f:
+		rows = list(csv.DictReader(f))
+	return [row["message"] for row in rows], np.array([int(row["sentiment"]) for row in rows])
+
+
+def _reserved(text, every):
+	"""Whether a correction is kept back for evaluation instead of being trained on."""
+	return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big") % every == 0
+
+
+class OnlineLearner:
+	"""Background mini-batch ``partial_fit`` with snapshotting and an accuracy guard."""
+
+	def __init__(self, model_name=SGD_MODEL, snapshot_dir=SNAPSHOT_DIR, batch_size=32, interval=30.0,
+			tolerance=0.005, holdout_csv=HOLDOUT_CSV, holdout_every=HOLDOUT_EVERY,
+			allow_unguarded=ALLOW_UNGUARDED, keep=KEEP_SNAPSHOTS):
+		self.model_name = model_name
+		self.snapshot_dir = snapshot_dir
+		self.manifest_path = os.path.join(snapshot_dir, "manifest.json")
+		self.feedback_path = os.path.join(snapshot_dir, "feedback.jsonl")
+		self.holdout_path = os.path.join(snapshot_dir, "holdout.jsonl")
+		self.batch_size = batch_size
+		self.interval = interval
+		self.tolerance = tolerance
+		self.allow_unguarded = allow_unguarded
+		self.keep = keep
+		self._file_holdout = _read_holdout(holdout_csv)
+		# Only reserve corrections when there is no labelled holdout file
+		self.holdout_every = holdout_every if self._file_holdout is None else 0
+		self._reserved = self._read_reserved()
+		self._queue = queue.Queue()
+		# Examples held back until there is a holdout to check an update against
+		self._deferred = []
+		self._update_lock = threading.Lock()
+		self._manifest_mtime = None
+		self._thread = None
+		self._stop = threading.Event()
+		self.current_version = 0
+
+	def _label(self, label):
+		"""The numeric class for ``label`` (``-1``, ``"-1"`` or ``"Anti"``), or ``None`` if the model has no such class."""
+		names = {name.lower(): value for value, name in inference.LABELS.items()}
+		try:
+			value = int(label)
+		except (TypeError, ValueError):
+			value = names.get(str(label).strip().lower())
+		classes = registry.get(self.model_name).classes_
+		return value if value is not None and value in classes else None
+
+	def submit(self, text, label):
+		"""Queue a corrected ``label`` (e.g. ``-1``) for ``text``; raises ``ValueError`` for an unknown label."""
+		if not self.submit_many([(text, label)]):
+			raise ValueError("unknown sentiment label {!r}".format(label))
+
+	def submit_many(self, examples):
+		"""Queue labelled examples, skipping (and logging) rows with unknown labels; returns how many were queued."""
+		rows, examples, rejected = examples, [], 0
+		for text, label in rows:
+			value = self._label(label)
+			if value is None:
+				rejected += 1
+				logger.warning("Ignoring feedback with unknown label %r", label)
+			else:
+				examples.append((str(text), value))
+		if rejected:
+			metrics.increment("feedback_rejected", rejected, model=self.model_name)
+		if not examples:
+			return 0
+		os.makedirs(self.snapshot_dir, exist_ok=True)
+		now = datetime.datetime.now().isoformat(sep=" ")
+		with open(self.feedback_path, "a", encoding="utf-8") as f:
+			for text, label in examples:
+				f.write(json.dumps({"time": now, "text": text, "label": label}) + "\n")
+		for text, label in examples:
+			if self.holdout_every and _reserved(text, self.holdout_every):
+				self._reserve(text, label)
+			else:
+				self._queue.put((text, label))
+		metrics.increment("feedback", len(examples), model=self.model_name)
+		return len(examples)
+
+	def pending(self):
+		return self._queue.qsize() + len(self._deferred)
+
+	def start(self):
+		"""Restore the latest accepted snapshot and start the background thread."""
+		self.sync()
+		if self._thread is None or not self._thread.is_alive():
+			self._stop.clear()
+			self._thread = threading.Thread(target=self._run, name="online-learner", daemon=True)
+			self._thread.start()
+		return self
+
+	def stop(self):
+		self._stop.set()
+		if self._thread:
+			self._thread.join()
+
+	def _run(self):
+		while not self._stop.is_set():
+			batch = self._collect()
+			if batch:
+				try:
+					self.update(batch)
+				except Exception:
+					logger.exception("Online update failed; %d examples dropped", len(batch))
+			self.sync()
+
+	def _collect(self):
+		"""Wait up to ``interval`` seconds for a full mini-batch; return whatever arrived."""
+		batch = []
+		deadline = time.monotonic() + self.interval
+		while len(batch) < self.batch_size and not self._stop.is_set():
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				break
+			try:
+				batch.append(self._queue.get(timeout=min(remaining, 1.0)))
+			except queue.Empty:
+				pass
+		return batch
+
+	def flush(self):
+		"""Apply everything queued so far in the calling thread; returns the snapshot records."""
+		records = []
+		while True:
+			batch = []
+			while len(batch) < self.batch_size:
+				try:
+					batch.append(self._queue.get_nowait())
+				except queue.Empty:
+					break
+			if not batch:
+				return records
+			record = self.update(batch)
+			if record is not None:
+				records.append(record)
+
+	def _read_reserved(self):
+		try:
+			with open(self.holdout_path, encoding="utf-8") as f:
+				return [tuple(json.loads(line)) for line in f if line.strip()]
+		except FileNotFoundError:
+			return []
+
+	def _reserve(self, text, label):
+		with open(self.holdout_path, "a", encoding="utf-8") as f:
+			f.write(json.dumps([text, label]) + "\n")
+		self._reserved.append((text, label))
+
+	def _holdout_set(self):
+		if self._file_holdout is not None:
+			return self._file_holdout
+		reserved = list(self._reserved)
+		if len(reserved) < MIN_HOLDOUT:
+			return None
+		texts, labels = zip(*reserved)
+		return list(texts), np.array(labels)
+
+	def accuracy(self, model):
+		"""Accuracy of ``model`` on the holdout set, or ``None`` without one."""
+		holdout = self._holdout_set()
+		if holdout is None:
+			return None
+		texts, labels = holdout
+		predicted = inference.predict_texts(model, registry.get(VECTORIZER), texts, model_name=self.model_name)
+		return float(np.mean(predicted == labels))
+
+	def update(self, batch):
+		"""Fit a copy of the live model on ``batch`` and promote it if it passes the guard.
+
+		Returns the manifest record, or ``None`` when there is no holdout yet and
+		the batch is kept for later instead.
+		"""
+		with self._update_lock:
+			if self._holdout_set() is None and not self.allow_unguarded:
+				self._deferred.extend(batch)
+				logger.info("No holdout to check updates against yet; %d examples waiting", len(self._deferred))
+				return None
+			batch, self._deferred = self._deferred + list(batch), []
+			with timer("online_update", self.model_name):
+				return self._update(batch)
+
+	def _update(self, batch):
+		live = registry.get(self.model_name)
+		texts, labels = zip(*batch)
+		candidate = copy.deepcopy(live)
+		X = registry.get(VECTORIZER).transform(texts)
+		candidate.partial_fit(X, np.asarray(labels), classes=live.classes_)
+
+		before, after = self.accuracy(live), self.accuracy(candidate)
+		record = {
+			"created": datetime.datetime.now().isoformat(sep=" "),
+			"examples": len(batch),
+			"accuracy_before": before,
+			"accuracy_after": after,
+		}
+		if before is not None and after < before - self.tolerance:
+			record["status"] = "rolled_back"
+			metrics.increment("online_rollback", model=self.model_name)
+			logger.warning("Online update rolled back: holdout accuracy %.4f -> %.4f", before, after)
+			self._record(record)
+			return record
+
+		manifest = self._manifest()
+		version = max([v.get("version", 0) for v in manifest["versions"]] + [0]) + 1
+		path = os.path.join(self.snapshot_dir, "sgd-v{:04d}.pkl".format(version))
+		os.makedirs(self.snapshot_dir, exist_ok=True)
+		tmp = path + ".tmp"
+		joblib.dump(candidate, tmp)
+		os.replace(tmp, path)
+		record.update(version=version, path=os.path.basename(path), status="accepted")
+		self._record(record, active=version)
+		registry.swap(self.model_name, candidate, path)
+		self.current_version = version
+		self._prune()
+		return record
+
+	def _manifest(self):
+		try:
+			with open(self.manifest_path) as f:
+				return json.load(f)
+		except (FileNotFoundError, ValueError):
+			return {"versions": [], "active": 0}
+
+	def _record(self, record=None, active=None):
+		"""Append ``record`` to the manifest and/or mark snapshot ``active`` as the one to serve."""
+		os.makedirs(self.snapshot_dir, exist_ok=True)
+		manifest = self._manifest()
+		if record is not None:
+			manifest["versions"].append(record)
+		if active is not None:
+			manifest["active"] = active
+		self._write_manifest(manifest)
+
+	def _write_manifest(self, manifest):
+		tmp = self.manifest_path + ".tmp"
+		with open(tmp, "w") as f:
+			json.dump(manifest, f, indent=1)
+		os.replace(tmp, self.manifest_path)
+		self._manifest_mtime = os.stat(self.manifest_path).st_mtime_ns
+
+	def _prune(self):
+		"""Delete the files of all but the newest ``keep`` accepted snapshots and the active one."""
+		if not self.keep:
+			return
+		manifest = self._manifest()
+		kept = [v["version"] for v in manifest["versions"] if v.get("status") == "accepted" and not v.get("pruned")]
+		stale = set(kept[:-self.keep]) - {manifest.get("active")}
+		if not stale:
+			return
+		for record in manifest["versions"]:
+			if record.get("version") in stale:
+				try:
+					os.remove(os.path.join(self.snapshot_dir, record["path"]))
+				except FileNotFoundError:
+					pass
+				record["pruned"] = True
+		self._write_manifest(manifest)
+
+	def versions(self):
+		"""Every recorded update, oldest first."""
+		return self._manifest()["versions"]
+
+	def sync(self):
+		"""Serve the snapshot marked active in the manifest, e.g. by another process or before a restart."""
+		try:
+			mtime = os.stat(self.manifest_path).st_mtime_ns
+		except FileNotFoundError:
+			return
+		if mtime == self._manifest_mtime:
+			return
+		self._manifest_mtime = mtime
+		active = self._manifest().get("active", 0)
+		if active != self.current_version:
+			self._load(active)
+
+	def activate(self, version):
+		"""Serve snapshot ``version`` (0 means the shipped artifact) from now on, here and elsewhere."""
+		self._load(version)
+		self._record(active=version)
+
+	def _load(self, version):
+		with self._update_lock:
+			if version == 0:
+				path = os.path.join(RESOURCES_DIR, DEFAULT_ARTIFACTS[self.model_name])
+			else:
+				path = os.path.join(self.snapshot_dir, "sgd-v{:04d}.pkl".format(version))
+			with open(path, "rb") as f:
+				model = joblib.load(f)
+			registry.swap(self.model_name, model, path)
+			self.current_version = version
+
+	def rollback(self):
+		"""Go back to the accepted snapshot before the current one."""
+		accepted = [v["version"] for v in self.versions() if v.get("status") == "accepted" and not v.get("pruned")]
+		previous = [v for v in accepted if v < self.current_version]
+		self.activate(previous[-1] if previous else 0)
+
+
+_learner = None
+_learner_lock = threading.Lock()
+
+
+def get_learner():
+	"""Return the process-wide learner, starting its background thread on first use."""
+	global _learner
+	with _learner_lock:
+		if _learner is None:
+			_learner = OnlineLearner().start()
+		return _learner
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Apply a file of corrected labels to the SGD model.")
+	parser.add_argument("input", help="CSV or JSONL file of labelled tweets")
+	parser.add_argument("--text-field", default="message")
+	parser.add_argument("--label-field", default="sentiment")
+	parser.add_argument("--batch-size", type=int, default=256)
+	args = parser.parse_args(argv)
+
+	learner = OnlineLearner(batch_size=args.batch_size)
+	learner.sync()
+	with open(args.input, newline="", encoding="utf-8") as f:
+		if args.input.endswith((".jsonl", ".json")):
+			rows = [json.loads(line) for line in f if line.strip()]
+		else:
+			rows = list(csv.DictReader(f))
+	queued = learner.submit_many((row[args.text_field], row[args.label_field]) for row in rows)
+	if queued < len(rows):
+		print("Skipped {:,} rows with unknown labels".format(len(rows) - queued))
+	for record in learner.flush():
+		print(json.dumps(record))
+	if learner.pending():
+		print("{:,} corrections not applied: no holdout to check them against yet".format(learner.pending()))
+
+
+if __name__ == "__main__":
+	main()
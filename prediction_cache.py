@@ -0,0 +1,153 @@
+"""
+
+    Bounded LRU cache of predictions keyed on normalized tweet text.
+
+    Description: Retweets and copy-pasted tweets are common, so the same text
+	is classified over and over. Entries are keyed on a hash of the
+	normalized text and the model name, evicted least-recently-used once
+	``max_size`` is reached, and dropped for a model as soon as the checksum
+	of its (or the vectorizer's) artifact changes in the registry.
+
+	Normalization never changes the prediction: the vectorizer lowercases
+	and ignores whitespace anyway, and a ``t.co`` link id is only replaced
+	with a placeholder when that id is not in the vocabulary, in which case
+	it contributes no features either.
+
+"""
+import collections
+import hashlib
+import os
+import re
+import threading
+
+import inference
+from metrics import metrics, timer
+from model_registry import registry, MODEL_NAMES, VECTORIZER
+
+DEFAULT_MAX_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", 10000))
+
+_TCO_URL = re.compile(r"https?://t\.co/(\w+)")
+_WHITESPACE = re.compile(r"\s+")
+# Stands in for unknown t.co ids; deliberately absent from the vocabulary
+_URL_PLACEHOLDER = "https://t.co/tcourlplaceholder"
+
+
+def normalize_text(text, vocabulary=None):
+	"""Lowercase, collapse whitespace and mask out-of-vocabulary ``t.co`` links."""
+	text = text.lower()
+
+	def mask(match):
+		if vocabulary is not None and match.group(1) in vocabulary:
+			return match.group(0)
+		return _URL_PLACEHOLDER
+
+	text = _TCO_URL.sub(mask, text)
+	return _WHITESPACE.sub(" ", text).strip()
+
+
+def text_key(text, vocabulary=None):
+	"""Return the hash used to identify ``text`` in the cache."""
+	return hashlib.blake2b(normalize_text(text, vocabulary).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class PredictionCache:
+	"""Thread-safe LRU mapping of ``(model, text hash)`` to a prediction."""
+
+	def __init__(self, max_size=DEFAULT_MAX_SIZE):
+		self.max_size = max_size
+		self._entries = collections.OrderedDict()
+		self._versions = {}
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.invalidations = 0
+
+	def check_version(self, model_name, version):
+		"""Drop every entry for ``model_name`` if its artifacts changed since they were cached."""
+		with self._lock:
+			if self._versions.get(model_name) == version:
+				return
+			stale = [key for key in self._entries if key[0] == model_name]
+			for key in stale:
+				del self._entries[key]
+			self.invalidations += len(stale)
+			self._versions[model_name] = version
+
+	def get(self, model_name, key, default=None):
+		with self._lock:
+			try:
+				value = self._entries[(model_name, key)]
+			except KeyError:
+				self.misses += 1
+				return default
+			self._entries.move_to_end((model_name, key))
+			self.hits += 1
+			return value
+
+	def put(self, model_name, key, value):
+		with self._lock:
+			self._entries[(model_name, key)] = value
+			self._entries.move_to_end((model_name, key))
+			while len(self._entries) > self.max_size:
+				self._entries.popitem(last=False)
+				self.evictions += 1
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self._versions.clear()
+
+	def stats(self):
+		"""Return the hit/miss/eviction counters and current size."""
+		with self._lock:
+			lookups = self.hits + self.misses
+			return {
+				"size": len(self._entries),
+				"max_size": self.max_size,
+				"hits": self.hits,
+				"misses": self.misses,
+				"hit_rate": self.hits / lookups if lookups else 0.0,
+				"evictions": self.evictions,
+				"invalidations": self.invalidations,
+			}
+
+
+# Shared by the Streamlit app and the batch tools in this process
+cache = PredictionCache()
+metrics.add_collector(lambda: {"prediction_cache_" + k: v for k, v in cache.stats().items()})
+
+
+def _version(model_name):
+	names = MODEL_NAMES if model_name == inference.ENSEMBLE else [model_name]
+	return tuple(registry.checksum(name) for name in [VECTORIZER] + names)
+
+
+def predict_texts(model_name, texts, prediction_cache=None):
+	"""Return the numeric sentiment of each text, scoring only the cache misses.
+
+	``model_name`` is a registry name or :data:`inference.ENSEMBLE` for the
+	majority vote of all models.
+	"""
+	prediction_cache = prediction_cache or cache
+	prediction_cache.check_version(model_name, _version(model_name))
+	vectorizer = registry.get(VECTORIZER)
+	with timer("cache_lookup", model_name):
+		keys = [text_key(text, vectorizer.vocabulary_) for text in texts]
+		results = [prediction_cache.get(model_name, key) for key in keys]
+	missing = {}
+	for i, (key, result) in enumerate(zip(keys, results)):
+		if result is None:
+			missing.setdefault(key, i)
+	if missing:
+		miss_texts = [texts[i] for i in missing.values()]
+		if model_name == inference.ENSEMBLE:
+			models = {name: registry.get(name) for name in MODEL_NAMES}
+			labels = inference.compare_texts(models, vectorizer, miss_texts, model_name=model_name)[0][inference.ENSEMBLE]
+		else:
+			labels = inference.predict_texts(registry.get(model_name), vectorizer, miss_texts, model_name=model_name)
+		computed = dict(zip(missing, labels.tolist()))
+		for key, label in computed.items():
+			prediction_cache.put(model_name, key, label)
+		results = [computed[key] if result is None else result for key, result in zip(keys, results)]
+	return results
@@ -0,0 +1,167 @@
+"""
+
+    Nearest labelled training tweets for a piece of text.
+
+    Description: Every message in ``resources/train.csv`` is vectorized with
+	``tweet_cv`` and L2-normalized, and the result is stored transposed as
+	an inverted index: one row per vocabulary term listing the training
+	tweets that contain it and their weights. A query only touches the
+	posting lists of its own terms, so finding the most cosine-similar
+	tweets takes milliseconds instead of a pass over the whole training set.
+
+	The index is persisted to ``resources/.cache/similar_index.npz``. When the
+	training data changes and the rows already indexed (messages and
+	sentiments) are untouched, i.e. new tweets were appended, only the new
+	rows are vectorized and added; otherwise, or when ``vect.pkl`` changes,
+	it is rebuilt from scratch.
+
+    Usage:
+
+	python similar_tweets.py "the planet is on fire" -k 5
+
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+
+import inference
+import training_data
+from metrics import timer
+from model_registry import registry, VECTORIZER
+
+INDEX_PATH = os.path.join(training_data.CACHE_DIR, "similar_index.npz")
+INDEX_VERSION = 2
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def _digest(messages, sentiments):
+	"""Hash of the indexed messages and their labels, used to tell an append from an edit."""
+	digest = hashlib.sha256()
+	for message, sentiment in zip(messages, sentiments):
+		digest.update("{}\0{}\0".format(sentiment, message).encode("utf-8"))
+	return digest.hexdigest()
+
+
+class SimilarityIndex:
+	"""Inverted index (terms x tweets) over the ``tweet_cv`` features of the training tweets."""
+
+	def __init__(self, postings, sentiments, meta):
+		self.postings = postings.tocsr()
+		self.sentiments = np.asarray(sentiments)
+		self.meta = meta
+
+	def __len__(self):
+		return self.postings.shape[1]
+
+	@classmethod
+	def build(cls, messages, sentiments, vectorizer, checksum):
+		"""Index ``messages`` from scratch."""
+		index = cls(sp.csr_matrix((len(vectorizer.vocabulary_), 0), dtype=np.float32), np.empty(0, dtype=np.int64),
+			{"version": INDEX_VERSION, "vectorizer": checksum, "rows": 0, "digest": _digest([], [])})
+		return index.extend(messages, sentiments, vectorizer)
+
+	def extend(self, messages, sentiments, vectorizer):
+		"""Return a new index with ``messages`` appended after the tweets already indexed."""
+		messages = [str(m) for m in messages]
+		docs = normalize(vectorizer.transform(messages).astype(np.float32))
+		postings = sp.hstack([self.postings, docs.T.tocsr()], format="csr")
+		meta = dict(self.meta, rows=len(self) + len(messages))
+		return SimilarityIndex(postings, np.concatenate([self.sentiments, np.asarray(sentiments)]), meta)
+
+	def query(self, X, k=5):
+		"""Return ``(rows, similarities)`` of the ``k`` most similar indexed tweets to vector ``X``."""
+		q = normalize(X.astype(np.float32))
+		# Only the posting lists of the query's terms are touched
+		scores = (q @ self.postings).tocsr()
+		rows, similarities = scores.indices, scores.data
+		if len(rows) > k:
+			top = np.argpartition(-similarities, k - 1)[:k]
+			rows, similarities = rows[top], similarities[top]
+		order = np.argsort(-similarities, kind="stable")
+		return rows[order], similarities[order]
+
+	def save(self, path=INDEX_PATH):
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		tmp = path + ".tmp.npz"
+		np.savez(tmp, data=self.postings.data, indices=self.postings.indices, indptr=self.postings.indptr,
+			shape=np.asarray(self.postings.shape), sentiments=self.sentiments, meta=json.dumps(self.meta))
+		os.replace(tmp, path)
+
+	@classmethod
+	def load(cls, path=INDEX_PATH):
+		"""Read a saved index, or return ``None`` if there is none or it is unreadable."""
+		try:
+			with np.load(path) as f:
+				postings = sp.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"]))
+				return cls(postings, f["sentiments"], json.loads(str(f["meta"])))
+		except (FileNotFoundError, ValueError, KeyError, OSError):
+			return None
+
+
+def update_index(df, index_path=INDEX_PATH):
+	"""Bring the persisted index up to date with the training DataFrame ``df`` and return it."""
+	vectorizer = registry.get(VECTORIZER)
+	checksum = registry.checksum(VECTORIZER)
+	messages = df["message"].astype(str).tolist()
+	sentiments = df["sentiment"].tolist()
+	index = SimilarityIndex.load(index_path)
+	if index is not None:
+		meta = index.meta
+		if meta.get("version") != INDEX_VERSION or meta.get("vectorizer") != checksum or \
+				meta["rows"] > len(messages) or meta["digest"] != _digest(messages[:meta["rows"]], sentiments[:meta["rows"]]):
+			index = None
+	with timer("similar_index_build"):
+		if index is None:
+			index = SimilarityIndex.build(messages, df["sentiment"], vectorizer, checksum)
+		elif len(index) < len(messages):
+			index = index.extend(messages[len(index):], df["sentiment"].iloc[len(index):], vectorizer)
+		else:
+			return index
+	index.meta["digest"] = _digest(messages, sentiments)
+	index.save(index_path)
+	return index
+
+
+def get_index(csv_path=training_data.TRAIN_CSV, index_path=INDEX_PATH):
+	"""Return the index for ``csv_path``, updating it only when the training data was reloaded."""
+	df = training_data.load_training_data(csv_path)
+	with _lock:
+		cached = _loaded.get(index_path)
+		if cached is None or cached[0] is not df or cached[1].meta["vectorizer"] != registry.checksum(VECTORIZER):
+			cached = _loaded[index_path] = (df, update_index(df, index_path))
+		return cached[1]
+
+
+def similar(text, k=5, csv_path=training_data.TRAIN_CSV):
+	"""Return the ``k`` training tweets most similar to ``text`` as a list of dicts."""
+	index = get_index(csv_path)
+	df = training_data.load_training_data(csv_path)
+	with timer("similar_lookup"):
+		rows, similarities = index.query(registry.get(VECTORIZER).transform([text]), k)
+	return [{
+		"sentiment": inference.LABELS.get(index.sentiments[row], index.sentiments[row]),
+		"similarity": float(similarity),
+		"message": df["message"].iat[row],
+		"tweetid": df["tweetid"].iat[row] if "tweetid" in df.columns else None,
+	} for row, similarity in zip(rows, similarities)]
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Find the training tweets most similar to a text.")
+	parser.add_argument("text")
+	parser.add_argument("-k", type=int, default=5)
+	args = parser.parse_args(argv)
+	for match in similar(args.text, args.k):
+		print("{similarity:.3f}  {sentiment:<8} {message}".format(**match))
+
+
+if __name__ == "__main__":
+	main()
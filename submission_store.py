@@ -0,0 +1,245 @@
+"""
+
+    Append-only storage for Contact form submissions.
+
+    Description: Each submission is appended as a single row; the page never
+	reads the existing history to add to it. Two backends are provided:
+
+	- ``sqlite`` (default): an embedded database in WAL mode, so concurrent
+	  sessions can append without losing writes, with indexes on email and
+	  time for lookups
+	- ``jsonl``: one JSON object per line, appended under an exclusive file
+	  lock; lookups scan the file
+
+	The backend is chosen with the ``SUBMISSION_STORE`` environment variable
+	(``sqlite`` or ``jsonl``). The first time a store is opened, any rows in
+	the legacy ``users.csv`` are imported once.
+
+"""
+import abc
+import csv
+import datetime
+import json
+import os
+import sqlite3
+import threading
+
+try:
+	import fcntl
+except ImportError:  # Windows - appends still go through a single write call
+	fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LEGACY_CSV = os.path.join(BASE_DIR, "users.csv")
+DEFAULT_PATHS = {
+	"sqlite": os.path.join(BASE_DIR, "users.db"),
+	"jsonl": os.path.join(BASE_DIR, "users.jsonl"),
+}
+FIELDS = ["time", "name", "lastname", "email", "phone", "method", "message"]
+
+
+def _timestamp(value):
+	if isinstance(value, datetime.datetime):
+		return value.isoformat(sep=" ")
+	return str(value)
+
+
+class SubmissionStore(abc.ABC):
+	"""Interface shared by the storage backends."""
+
+	@abc.abstractmethod
+	def append(self, submission):
+		"""Atomically store one submission (a dict with the keys in ``FIELDS``)."""
+
+	@abc.abstractmethod
+	def find_by_email(self, email):
+		"""Return every submission sent from ``email``, oldest first."""
+
+	@abc.abstractmethod
+	def between(self, start, end):
+		"""Return submissions with ``start <= time < end``, oldest first."""
+
+	@abc.abstractmethod
+	def count(self):
+		"""Return the number of stored submissions."""
+
+	@abc.abstractmethod
+	def migrate_csv(self, csv_path=LEGACY_CSV):
+		"""Import ``csv_path`` once; returns the number of rows imported."""
+
+
+def _read_legacy_csv(csv_path):
+	with open(csv_path, newline="", encoding="utf-8") as f:
+		return [{field: row.get(field, "") for field in FIELDS} for row in csv.DictReader(f)]
+
+
+class SQLiteSubmissionStore(SubmissionStore):
+	"""Submissions in an SQLite database using write-ahead logging."""
+
+	def __init__(self, path=DEFAULT_PATHS["sqlite"]):
+		self.path = path
+		self._local = threading.local()
+		# WAL lets readers and a writer proceed concurrently; it persists in the file
+		self._connection().execute("PRAGMA journal_mode=WAL")
+		with self._connect() as conn:
+			conn.execute(
+				"CREATE TABLE IF NOT EXISTS submissions ("
+				"id INTEGER PRIMARY KEY AUTOINCREMENT, {})".format(", ".join("{} TEXT".format(f) for f in FIELDS)))
+			conn.execute("CREATE INDEX IF NOT EXISTS submissions_email ON submissions (email)")
+			conn.execute("CREATE INDEX IF NOT EXISTS submissions_time ON submissions (time)")
+			conn.execute("CREATE TABLE IF NOT EXISTS migrations (name TEXT PRIMARY KEY, applied_at TEXT)")
+
+	def _connection(self):
+		# One connection per thread; Streamlit runs each session in its own thread
+		conn = getattr(self._local, "conn", None)
+		if conn is None:
+			conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+			conn.row_factory = sqlite3.Row
+			conn.execute("PRAGMA synchronous=NORMAL")
+			self._local.conn = conn
+		return conn
+
+	def _connect(self):
+		return _Transaction(self._connection())
+
+	def append(self, submission):
+		values = [_timestamp(submission["time"])] + [submission[f] for f in FIELDS[1:]]
+		with self._connect() as conn:
+			conn.execute("INSERT INTO submissions ({}) VALUES ({})".format(
+				", ".join(FIELDS), ", ".join("?" * len(FIELDS))), values)
+
+	def _select(self, where, params):
+		rows = self._connection().execute("SELECT {} FROM submissions WHERE {} ORDER BY time, id".format(
+			", ".join(FIELDS), where), params).fetchall()
+		return [dict(row) for row in rows]
+
+	def find_by_email(self, email):
+		return self._select("email = ?", (email,))
+
+	def between(self, start, end):
+		return self._select("time >= ? AND time < ?", (_timestamp(start), _timestamp(end)))
+
+	def count(self):
+		return self._connection().execute("SELECT COUNT(*) FROM submissions").fetchone()[0]
+
+	def migrate_csv(self, csv_path=LEGACY_CSV):
+		name = "import:" + os.path.basename(csv_path)
+		if not os.path.exists(csv_path):
+			return 0
+		with self._connect() as conn:
+			if conn.execute("SELECT 1 FROM migrations WHERE name = ?", (name,)).fetchone():
+				return 0
+			rows = _read_legacy_csv(csv_path)
+			conn.executemany("INSERT INTO submissions ({}) VALUES ({})".format(
+				", ".join(FIELDS), ", ".join("?" * len(FIELDS))), [[r[f] for f in FIELDS] for r in rows])
+			conn.execute("INSERT INTO migrations VALUES (?, ?)", (name, _timestamp(datetime.datetime.now())))
+		return len(rows)
+
+
+class _Transaction:
+	"""``BEGIN IMMEDIATE`` ... ``COMMIT``/``ROLLBACK`` around an autocommit connection."""
+
+	def __init__(self, conn):
+		self.conn = conn
+
+	def __enter__(self):
+		self.conn.execute("BEGIN IMMEDIATE")
+		return self.conn
+
+	def __exit__(self, exc_type, exc, tb):
+		self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class JSONLSubmissionStore(SubmissionStore):
+	"""Submissions appended to a JSON-lines file.
+
+	Like the ``migrations`` table of the SQLite backend, completed imports
+	are recorded in the data file itself, as ``{"_migration": ...}`` lines.
+	"""
+
+	MIGRATION_KEY = "_migration"
+
+	def __init__(self, path=DEFAULT_PATHS["jsonl"]):
+		self.path = path
+		# Written by earlier versions instead of a migration line
+		self.marker_path = path + ".migrated"
+
+	def _write_lines(self, records, unless=None):
+		"""Append ``records`` under an exclusive lock, unless ``unless()`` is true once it is held."""
+		data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+		fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+		try:
+			if fcntl:
+				fcntl.flock(fd, fcntl.LOCK_EX)
+			if unless is not None and unless():
+				return False
+			os.write(fd, data)
+			os.fsync(fd)
+			return True
+		finally:
+			os.close(fd)
+
+	def append(self, submission):
+		record = {f: submission[f] for f in FIELDS}
+		record["time"] = _timestamp(record["time"])
+		self._write_lines([record])
+
+	def _records(self):
+		"""Every line of the file, submissions and migration records alike."""
+		if not os.path.exists(self.path):
+			return []
+		with open(self.path, encoding="utf-8") as f:
+			return [json.loads(line) for line in f if line.strip()]
+
+	def _scan(self, predicate):
+		records = (r for r in self._records() if self.MIGRATION_KEY not in r)
+		return sorted((r for r in records if predicate(r)), key=lambda r: r["time"])
+
+	def find_by_email(self, email):
+		return self._scan(lambda r: r["email"] == email)
+
+	def between(self, start, end):
+		start, end = _timestamp(start), _timestamp(end)
+		return self._scan(lambda r: start <= r["time"] < end)
+
+	def count(self):
+		if not os.path.exists(self.path):
+			return 0
+		migration = '{{"{}"'.format(self.MIGRATION_KEY).encode("utf-8")
+		with open(self.path, "rb") as f:
+			return sum(1 for line in f if line.strip() and not line.startswith(migration))
+
+	def _migrated(self, name):
+		return any(r.get(self.MIGRATION_KEY) == name for r in self._records())
+
+	def migrate_csv(self, csv_path=LEGACY_CSV):
+		name = "import:" + os.path.basename(csv_path)
+		if not os.path.exists(csv_path) or os.path.exists(self.marker_path):
+			return 0
+		rows = _read_legacy_csv(csv_path)
+		# The rows and the record of their import are one locked write, so a
+		# crash cannot leave either without the other, and only one process imports
+		marker = {self.MIGRATION_KEY: name, "applied_at": _timestamp(datetime.datetime.now())}
+		if not self._write_lines(rows + [marker], unless=lambda: self._migrated(name)):
+			return 0
+		return len(rows)
+
+
+BACKENDS = {"sqlite": SQLiteSubmissionStore, "jsonl": JSONLSubmissionStore}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+	"""Return the process-wide store configured by ``SUBMISSION_STORE``, migrating ``users.csv`` once."""
+	global _store
+	with _store_lock:
+		if _store is None:
+			backend = os.environ.get("SUBMISSION_STORE", "sqlite")
+			if backend not in BACKENDS:
+				raise ValueError("Unknown SUBMISSION_STORE '{}', expected one of {}".format(backend, ", ".join(BACKENDS)))
+			store = BACKENDS[backend](os.environ.get("SUBMISSION_STORE_PATH", DEFAULT_PATHS[backend]))
+			store.migrate_csv()
+			_store = store
+		return _store
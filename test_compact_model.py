@@ -0,0 +1,79 @@
+"""
+
+    Parity of the compact bundle with the pickled vectorizer and models.
+
+    Usage:
+
+	python -m pytest -q test_compact_model.py
+
+"""
+import random
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+import compact_model
+import inference
+from benchmark import synthetic_corpus
+from load_test import SAMPLE_TWEETS
+from model_registry import registry, MODEL_NAMES, VECTORIZER
+
+
+@pytest.fixture(scope="module")
+def bundle(tmp_path_factory):
+	directory = str(tmp_path_factory.mktemp("compact"))
+	compact_model._export_registry(directory)
+	return compact_model.CompactBundle(directory)
+
+
+def _bigram_heavy(vocabulary, size=200, seed=7):
+	"""Tweets made of the vectorizer's own bigrams, in mixed case and punctuation."""
+	rng = random.Random(seed)
+	bigrams = sorted(term for term in vocabulary if " " in term)
+	tweets = []
+	for _ in range(size):
+		terms = [rng.choice(bigrams) for _ in range(rng.randint(3, 12))]
+		tweets.append(rng.choice([" ", ", ", "!! ", " - "]).join(terms).upper() if rng.random() < 0.3 else " ".join(terms))
+	return tweets
+
+
+CORPORA = {
+	"empty": ["", " ", "\n\t", "!!!", "   ...   "],
+	"unicode": [
+		"ünïcödé tweet about #climate",
+		"Климат меняется, and so should we",
+		"气候变化 is real 🌍🔥 https://t.co/abc123",
+		"café vs café - climate change",
+		"RT @user: it's 2°C already… #ClimateChange",
+	],
+	"samples": list(SAMPLE_TWEETS),
+}
+
+
+@pytest.mark.parametrize("corpus", sorted(CORPORA) + ["bigrams", "synthetic"])
+@pytest.mark.parametrize("model_name", MODEL_NAMES)
+def test_predictions_match_pickles(bundle, model_name, corpus):
+	vectorizer = registry.get(VECTORIZER)
+	if corpus == "bigrams":
+		texts = _bigram_heavy(vectorizer.vocabulary_)
+	elif corpus == "synthetic":
+		texts = synthetic_corpus(vectorizer.vocabulary_, 500)
+	else:
+		texts = CORPORA[corpus]
+	expected = inference.predict_texts(registry.get(model_name), vectorizer, texts)
+	actual = bundle.predict(model_name, texts)
+	assert int((np.asarray(expected) != np.asarray(actual)).sum()) == 0
+
+
+def test_features_match_vectorizer(bundle):
+	vectorizer = registry.get(VECTORIZER)
+	texts = CORPORA["empty"] + CORPORA["unicode"] + _bigram_heavy(vectorizer.vocabulary_, 50)
+	indptr, indices, data = bundle.vectorizer.transform(texts)
+	actual = sp.csr_matrix((data, indices, indptr), shape=(len(texts), bundle.vectorizer.n_features))
+	assert abs(vectorizer.transform(texts) - actual).max() == 0
+
+
+def test_verify_reports_no_mismatches(bundle):
+	texts = CORPORA["unicode"] + CORPORA["samples"]
+	assert compact_model.verify(bundle.directory, texts) == {name: 0 for name in MODEL_NAMES}
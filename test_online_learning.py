@@ -0,0 +1,61 @@
+"""
+
+    Versioning, guard and retention of the online SGD learner.
+
+    Usage:
+
+	python -m pytest -q test_online_learning.py
+
+"""
+import os
+
+import pytest
+
+import online_learning
+from load_test import SAMPLE_TWEETS
+from model_registry import registry, DEFAULT_ARTIFACTS
+
+BATCH = [(text, label) for text, label in zip(SAMPLE_TWEETS, [1, -1, 0, 2] * len(SAMPLE_TWEETS))]
+
+
+@pytest.fixture
+def learner(tmp_path, monkeypatch):
+	holdout = tmp_path / "holdout.csv"
+	holdout.write_text("message,sentiment\nthe planet is warming,1\n", encoding="utf-8")
+	learner = online_learning.OnlineLearner(snapshot_dir=str(tmp_path / "snapshots"), holdout_csv=str(holdout), keep=2)
+	yield learner
+	# Updates re-point the shared registry at the snapshot; go back to the shipped model
+	registry.register(learner.model_name, DEFAULT_ARTIFACTS[learner.model_name])
+
+
+def _accuracies(monkeypatch, learner, values):
+	values = iter(values)
+	monkeypatch.setattr(learner, "accuracy", lambda model: next(values))
+
+
+def test_accepted_update_after_rolled_back_candidate(learner, monkeypatch):
+	_accuracies(monkeypatch, learner, [0.9, 0.5, 0.9, 0.95])
+	assert learner.update(BATCH)["status"] == "rolled_back"
+	record = learner.update(BATCH)
+	assert record["status"] == "accepted" and record["version"] == 1
+	assert learner.current_version == 1
+	assert [v["status"] for v in learner.versions()] == ["rolled_back", "accepted"]
+
+
+def test_old_snapshots_are_pruned(learner, monkeypatch):
+	_accuracies(monkeypatch, learner, [0.9] * 8)
+	for _ in range(4):
+		learner.update(BATCH)
+	assert sorted(f for f in os.listdir(learner.snapshot_dir) if f.endswith(".pkl")) == ["sgd-v0003.pkl", "sgd-v0004.pkl"]
+	assert [v.get("pruned", False) for v in learner.versions()] == [True, True, False, False]
+	learner.rollback()
+	assert learner.current_version == 3
+	learner.rollback()
+	assert learner.current_version == 0
+
+
+def test_no_holdout_keeps_corrections_queued(tmp_path):
+	learner = online_learning.OnlineLearner(snapshot_dir=str(tmp_path / "snapshots"), holdout_csv=None, allow_unguarded=False)
+	assert learner.update(BATCH) is None
+	assert learner.pending() == len(BATCH)
+	assert learner.versions() == [] and learner.current_version == 0
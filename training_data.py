@@ -0,0 +1,140 @@
+"""
+
+    Lazy, cached access to the labelled training tweets.
+
+    Description: ``resources/train.csv`` is only read when a page actually
+	needs it. The first read converts it to a columnar cache file (Parquet
+	when pyarrow is installed, a pickle otherwise) under ``resources/.cache``
+	together with the CSV's size, mtime and sha256. Later processes load the
+	columnar file instead of re-parsing the CSV; the cache is rebuilt when
+	the CSV's contents change. Within a process the DataFrame is kept in
+	memory and shared by every session.
+
+	:func:`query` filters and paginates on the server so the browser only
+	ever receives a single page of rows.
+
+"""
+import json
+import os
+import threading
+
+import pandas as pd
+
+from metrics import timer
+from model_registry import RESOURCES_DIR, file_checksum
+
+TRAIN_CSV = os.path.join(RESOURCES_DIR, "train.csv")
+CACHE_DIR = os.path.join(RESOURCES_DIR, ".cache")
+COLUMNS = ["sentiment", "message", "tweetid"]
+
+try:
+	import pyarrow  # noqa: F401 - only needed for Parquet support
+	_CACHE_FORMAT = "parquet"
+except ImportError:
+	_CACHE_FORMAT = "pickle"
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def _cache_paths(csv_path):
+	stem = os.path.splitext(os.path.basename(csv_path))[0]
+	return (os.path.join(CACHE_DIR, "{}.{}".format(stem, _CACHE_FORMAT)),
+		os.path.join(CACHE_DIR, "{}.meta.json".format(stem)))
+
+
+def _signature(path):
+	st = os.stat(path)
+	return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _read_cache(data_path):
+	if _CACHE_FORMAT == "parquet":
+		return pd.read_parquet(data_path)
+	return pd.read_pickle(data_path)
+
+
+def _write_cache(df, data_path):
+	tmp = data_path + ".tmp"
+	if _CACHE_FORMAT == "parquet":
+		df.to_parquet(tmp, index=False)
+	else:
+		df.to_pickle(tmp)
+	os.replace(tmp, data_path)
+
+
+def _write_meta(meta_path, meta):
+	tmp = meta_path + ".tmp"
+	with open(tmp, "w") as f:
+		json.dump(meta, f)
+	os.replace(tmp, meta_path)
+
+
+def _load_from_disk(csv_path, signature):
+	data_path, meta_path = _cache_paths(csv_path)
+	try:
+		with open(meta_path) as f:
+			meta = json.load(f)
+	except (FileNotFoundError, ValueError):
+		meta = {}
+
+	if os.path.exists(data_path) and meta.get("format") == _CACHE_FORMAT:
+		if all(meta.get(k) == v for k, v in signature.items()):
+			return _read_cache(data_path)
+		# mtime or size changed - only rebuild if the contents did too
+		checksum = file_checksum(csv_path)
+		if meta.get("sha256") == checksum:
+			meta.update(signature)
+			_write_meta(meta_path, meta)
+			return _read_cache(data_path)
+	else:
+		checksum = file_checksum(csv_path)
+
+	df = pd.read_csv(csv_path)
+	df = df[[c for c in COLUMNS if c in df.columns]]
+	df["length"] = df["message"].astype(str).str.len()
+	os.makedirs(CACHE_DIR, exist_ok=True)
+	_write_cache(df, data_path)
+	_write_meta(meta_path, dict(signature, sha256=checksum, format=_CACHE_FORMAT))
+	return df
+
+
+def load_training_data(csv_path=TRAIN_CSV):
+	"""Return the training tweets (``sentiment``, ``message``, ``tweetid``, ``length``)."""
+	signature = _signature(csv_path)
+	with _lock:
+		cached = _loaded.get(csv_path)
+		if cached is not None and cached[0] == signature:
+			return cached[1]
+		with timer("training_data_load"):
+			df = _load_from_disk(csv_path, signature)
+		_loaded[csv_path] = (signature, df)
+		return df
+
+
+def filter_rows(df, sentiments=None, contains=None, min_length=None, max_length=None):
+	"""Return the rows of ``df`` matching every given filter.
+
+	``contains`` is a case-insensitive substring of the message.
+	"""
+	mask = pd.Series(True, index=df.index)
+	if sentiments:
+		mask &= df["sentiment"].isin(sentiments)
+	if min_length is not None:
+		mask &= df["length"] >= min_length
+	if max_length is not None:
+		mask &= df["length"] <= max_length
+	if contains:
+		mask &= df["message"].str.contains(contains, case=False, regex=False, na=False)
+	return df[mask]
+
+
+def page_count(total, page_size=50):
+	"""Number of pages needed for ``total`` rows (at least one, possibly empty)."""
+	return max(1, -(-total // page_size))
+
+
+def paginate(rows, page=0, page_size=50):
+	"""Return zero-based ``page`` of ``rows``, clamped to the last page."""
+	page = min(max(page, 0), page_count(len(rows), page_size) - 1)
+	return rows.iloc[page * page_size:(page + 1) * page_size]